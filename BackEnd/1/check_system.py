@@ -4,25 +4,34 @@ LiveTalking系统配置检查工具
 
 import os
 import sys
+import shutil
+import socket
 import subprocess
-from pathlib import Path
+import functools
+import io
 import importlib.util
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-def check_python():
+def check_python(out=sys.stdout):
     """检查Python版本"""
-    print("🔍 检查Python版本...")
+    print("🔍 检查Python版本...", file=out)
     version = sys.version_info
     if version >= (3, 8):
-        print(f"✅ Python {version.major}.{version.minor}.{version.micro}")
+        print(f"✅ Python {version.major}.{version.minor}.{version.micro}", file=out)
         return True
     else:
-        print(f"❌ Python版本过低: {version.major}.{version.minor}")
-        print("   需要Python 3.8+")
+        print(f"❌ Python版本过低: {version.major}.{version.minor}", file=out)
+        print("   需要Python 3.8+", file=out)
         return False
 
-def check_packages():
+@functools.lru_cache(maxsize=None)
+def _has(package):
+    """判断包是否可导入（结果缓存，已导入的包直接命中sys.modules）"""
+    return package in sys.modules or importlib.util.find_spec(package) is not None
+
+def check_packages(out=sys.stdout):
     """检查必要的包"""
-    print("\n🔍 检查依赖包...")
+    print("\n🔍 检查依赖包...", file=out)
     
     required = {
         "fastapi": "FastAPI",
@@ -34,85 +43,98 @@ def check_packages():
     
     missing = []
     for package, name in required.items():
-        spec = importlib.util.find_spec(package)
-        if spec is None:
-            print(f"❌ {name} 未安装")
+        if not _has(package):
+            print(f"❌ {name} 未安装", file=out)
             missing.append(package)
         else:
-            print(f"✅ {name} 已安装")
+            print(f"✅ {name} 已安装", file=out)
     
     if missing:
-        print(f"\n缺少的包: {', '.join(missing)}")
-        print("运行以下命令安装:")
-        print(f"pip install {' '.join(missing)}")
+        print(f"\n缺少的包: {', '.join(missing)}", file=out)
+        print("运行以下命令安装:", file=out)
+        print(f"pip install {' '.join(missing)}", file=out)
         return False
     
     return True
 
-def check_livetalking():
+def _scan(path):
+    """一次读取目录内容，返回 {名称: DirEntry}；目录不存在时返回None"""
+    try:
+        with os.scandir(path) as it:
+            return {entry.name: entry for entry in it}
+    except OSError:
+        return None
+
+def check_livetalking(out=sys.stdout):
     """检查LiveTalking"""
-    print("\n🔍 检查LiveTalking...")
+    print("\n🔍 检查LiveTalking...", file=out)
     
     # 默认路径
     default_path = r"D:\Projects\See You Again\src\LiveTalking\LiveTalking-main"
     
-    if os.path.exists(default_path):
-        print(f"✅ LiveTalking找到: {default_path}")
+    entries = _scan(default_path)
+    if entries is not None:
+        print(f"✅ LiveTalking找到: {default_path}", file=out)
         
         # 检查关键文件
-        app_py = os.path.join(default_path, "app.py")
-        wav2lip_dir = os.path.join(default_path, "wav2lip")
-        
-        if os.path.exists(app_py):
-            print("✅ app.py 存在")
+        if "app.py" in entries:
+            print("✅ app.py 存在", file=out)
         else:
-            print("❌ app.py 不存在")
+            print("❌ app.py 不存在", file=out)
             
-        if os.path.exists(wav2lip_dir):
-            print("✅ wav2lip目录 存在")
-            genavatar = os.path.join(wav2lip_dir, "genavatar.py")
-            if os.path.exists(genavatar):
-                print("✅ genavatar.py 存在")
+        wav2lip = entries.get("wav2lip")
+        if wav2lip is not None and wav2lip.is_dir():
+            print("✅ wav2lip目录 存在", file=out)
+            if "genavatar.py" in (_scan(wav2lip.path) or {}):
+                print("✅ genavatar.py 存在", file=out)
             else:
-                print("❌ genavatar.py 不存在")
+                print("❌ genavatar.py 不存在", file=out)
         else:
-            print("❌ wav2lip目录 不存在")
+            print("❌ wav2lip目录 不存在", file=out)
             
         return True
     else:
-        print(f"❌ LiveTalking未找到: {default_path}")
-        print("\n请修改 livetalking_backend.py 中的 LIVETALKING_PATH")
+        print(f"❌ LiveTalking未找到: {default_path}", file=out)
+        print("\n请修改 livetalking_backend.py 中的 LIVETALKING_PATH", file=out)
         return False
 
-def check_ffmpeg():
+def check_ffmpeg(out=sys.stdout):
     """检查FFmpeg"""
-    print("\n🔍 检查FFmpeg...")
+    print("\n🔍 检查FFmpeg...", file=out)
     
-    try:
-        result = subprocess.run(
-            ["ffmpeg", "-version"],
-            capture_output=True,
-            text=True
-        )
-        if result.returncode == 0:
-            version = result.stdout.split('\n')[0]
-            print(f"✅ FFmpeg已安装: {version}")
-            return True
-    except FileNotFoundError:
-        pass
+    # 只需确认是否安装，在PATH中查找即可，不必启动ffmpeg进程
+    ffmpeg_path = shutil.which("ffmpeg")
+    if ffmpeg_path:
+        print(f"✅ FFmpeg已安装: {ffmpeg_path}", file=out)
+        return True
     
-    print("⚠️  FFmpeg未安装（用于图片转视频）")
-    print("   下载地址: https://ffmpeg.org/download.html")
-    print("   安装后需要添加到系统PATH")
+    print("⚠️  FFmpeg未安装（用于图片转视频）", file=out)
+    print("   下载地址: https://ffmpeg.org/download.html", file=out)
+    print("   安装后需要添加到系统PATH", file=out)
     return False
 
-def check_ports():
+def _probe(port, service):
+    """探测单个端口能否被绑定"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    # Windows下SO_REUSEADDR允许抢占已占用端口，只在其他平台设置
+    if os.name != "nt":
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    try:
+        sock.bind(('localhost', port))
+        sock.listen(1)
+        available = True
+    except OSError:
+        available = False
+    finally:
+        sock.close()
+    
+    return port, service, not available
+
+def check_ports(out=sys.stdout):
     """检查端口占用"""
-    print("\n🔍 检查端口...")
+    print("\n🔍 检查端口...", file=out)
     
     try:
-        import socket
-        
         ports = {
             8000: "后端API",
             7860: "前端界面",
@@ -120,40 +142,61 @@ def check_ports():
             50000: "CosyVoice"
         }
         
+        # bind探测由内核立即返回，无需等待，直接依次探测即可
         for port, service in ports.items():
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            result = sock.connect_ex(('localhost', port))
-            sock.close()
-            
-            if result == 0:
-                print(f"⚠️  端口 {port} ({service}) 已被占用")
+            port, service, in_use = _probe(port, service)
+            if in_use:
+                print(f"⚠️  端口 {port} ({service}) 已被占用", file=out)
             else:
-                print(f"✅ 端口 {port} ({service}) 可用")
+                print(f"✅ 端口 {port} ({service}) 可用", file=out)
                 
     except Exception as e:
-        print(f"❌ 端口检查失败: {e}")
+        print(f"❌ 端口检查失败: {e}", file=out)
     
     return True
 
-def check_gpu():
+def check_gpu(out=sys.stdout):
     """检查GPU（可选）"""
-    print("\n🔍 检查GPU（可选）...")
+    print("\n🔍 检查GPU（可选）...", file=out)
+    
+    # 只确认PyTorch已安装，不实际导入（import torch需要数秒）
+    if not _has("torch"):
+        print("⚠️  PyTorch未安装，无法检查GPU", file=out)
+        return True
     
+    try:
+        result = subprocess.run(
+            ["nvidia-smi", "--query-gpu=name,memory.total", "--format=csv,noheader,nounits"],
+            capture_output=True,
+            text=True,
+            timeout=2
+        )
+        if result.returncode == 0 and result.stdout.strip():
+            name, memory = result.stdout.strip().split('\n')[0].rsplit(',', 1)
+            print(f"✅ CUDA可用: {name.strip()}", file=out)
+            print(f"   显存: {float(memory) / 1024:.1f} GB", file=out)
+        else:
+            print("⚠️  CUDA不可用，将使用CPU（速度较慢）", file=out)
+        return True
+    except (FileNotFoundError, subprocess.TimeoutExpired, ValueError):
+        pass
+    
+    # nvidia-smi不可用时回退到PyTorch
     try:
         import torch
         if torch.cuda.is_available():
-            print(f"✅ CUDA可用: {torch.cuda.get_device_name(0)}")
-            print(f"   显存: {torch.cuda.get_device_properties(0).total_memory / 1024**3:.1f} GB")
+            print(f"✅ CUDA可用: {torch.cuda.get_device_name(0)}", file=out)
+            print(f"   显存: {torch.cuda.get_device_properties(0).total_memory / 1024**3:.1f} GB", file=out)
         else:
-            print("⚠️  CUDA不可用，将使用CPU（速度较慢）")
+            print("⚠️  CUDA不可用，将使用CPU（速度较慢）", file=out)
     except ImportError:
-        print("⚠️  PyTorch未安装，无法检查GPU")
+        print("⚠️  PyTorch未安装，无法检查GPU", file=out)
     
     return True
 
-def check_files():
+def check_files(out=sys.stdout):
     """检查必要文件"""
-    print("\n🔍 检查项目文件...")
+    print("\n🔍 检查项目文件...", file=out)
     
     required_files = [
         "livetalking_backend.py",
@@ -161,37 +204,52 @@ def check_files():
         "requirements_backend.txt"
     ]
     
+    present = set(os.listdir("."))
     all_present = True
     for file in required_files:
-        if Path(file).exists():
-            print(f"✅ {file}")
+        if file in present:
+            print(f"✅ {file}", file=out)
         else:
-            print(f"❌ {file} 缺失")
+            print(f"❌ {file} 缺失", file=out)
             all_present = False
     
     return all_present
 
 def main():
     """主函数"""
-    print("=" * 50)
-    print("   LiveTalking 系统配置检查")
-    print("=" * 50)
+    # 所有输出先写入缓冲区，最后一次性写到控制台
+    out = io.StringIO()
+    print("=" * 50, file=out)
+    print("   LiveTalking 系统配置检查", file=out)
+    print("=" * 50, file=out)
     
-    results = []
+    checks = [
+        ("Python", check_python),
+        ("依赖包", check_packages),
+        ("项目文件", check_files),
+        ("LiveTalking", check_livetalking),
+        ("FFmpeg", check_ffmpeg),
+        ("端口", check_ports),
+        ("GPU", check_gpu),
+    ]
     
-    # 运行所有检查
-    results.append(("Python", check_python()))
-    results.append(("依赖包", check_packages()))
-    results.append(("项目文件", check_files()))
-    results.append(("LiveTalking", check_livetalking()))
-    results.append(("FFmpeg", check_ffmpeg()))
-    results.append(("端口", check_ports()))
-    results.append(("GPU", check_gpu()))
+    # 并发运行所有检查，各自输出到独立缓冲区，结束后按顺序打印
+    buffers = {name: io.StringIO() for name, _ in checks}
+    outcomes = {}
+    with ThreadPoolExecutor(max_workers=len(checks)) as ex:
+        futures = {ex.submit(check, buffers[name]): name for name, check in checks}
+        for future in as_completed(futures):
+            outcomes[futures[future]] = future.result()
+    
+    results = []
+    for name, _ in checks:
+        out.write(buffers[name].getvalue())
+        results.append((name, outcomes[name]))
     
     # 总结
-    print("\n" + "=" * 50)
-    print("   检查结果总结")
-    print("=" * 50)
+    print("\n" + "=" * 50, file=out)
+    print("   检查结果总结", file=out)
+    print("=" * 50, file=out)
     
     critical_pass = True
     for name, result in results:
@@ -202,20 +260,23 @@ def main():
         else:
             status = "✅" if result else "⚠️"
         
-        print(f"{status} {name}")
+        print(f"{status} {name}", file=out)
     
-    print("\n" + "=" * 50)
+    print("\n" + "=" * 50, file=out)
     
     if critical_pass:
-        print("✅ 系统检查通过，可以启动！")
-        print("\n运行以下命令启动系统:")
-        print("  python start_system_complete.py")
-        print("\n或双击运行:")
-        print("  start_windows.bat")
+        print("✅ 系统检查通过，可以启动！", file=out)
+        print("\n运行以下命令启动系统:", file=out)
+        print("  python start_system_complete.py", file=out)
+        print("\n或双击运行:", file=out)
+        print("  start_windows.bat", file=out)
     else:
-        print("❌ 存在关键问题，请先解决上述错误")
+        print("❌ 存在关键问题，请先解决上述错误", file=out)
+    
+    print("=" * 50, file=out)
     
-    print("=" * 50)
+    sys.stdout.write(out.getvalue())
+    sys.stdout.flush()
 
 if __name__ == "__main__":
     main()
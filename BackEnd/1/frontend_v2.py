@@ -1,8 +1,18 @@
 import gradio as gr
 import requests
+from requests.adapters import HTTPAdapter
+try:
+    from requests_toolbelt import MultipartEncoder
+except ImportError:
+    MultipartEncoder = None
+try:
+    import orjson
+except ImportError:
+    orjson = None
 import json
 import time
 import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from typing import Dict, List, Optional, Tuple
 from pathlib import Path
@@ -11,20 +21,40 @@ import os
 # ========== 配置 ==========
 BACKEND_API = "http://localhost:8000"
 WEBRTC_URL = "http://localhost:8010"
+HEALTH_CACHE_TTL = 5  # 健康检查结果缓存秒数，多个会话的定时器共享同一次请求
+
+# 复用连接的HTTP会话，避免每次请求重新建立TCP连接
+SESSION = requests.Session()
+SESSION.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+SESSION.headers.update({"Connection": "keep-alive"})
+
+def _json(response: requests.Response):
+    """解析后端JSON响应，优先使用orjson"""
+    if orjson is None:
+        return response.json()
+    return orjson.loads(response.content)
+
+# 数字人状态对应的显示图标
+_STATUS_EMOJI = {
+    "ready": "✅",
+    "running": "▶️",
+    "training": "🔄",
+    "error": "❌"
+}
 
 class DigitalHumanManager:
     """数字人管理器"""
     def __init__(self):
         self.avatars: Dict[str, dict] = {}
         self.current_avatar_id = None
-        self.refresh_avatars()
+        # 不在导入时请求后端，首次页面加载时再刷新列表
     
     def refresh_avatars(self) -> List[str]:
         """从后端刷新数字人列表"""
         try:
-            response = requests.get(f"{BACKEND_API}/avatars")
+            response = SESSION.get(f"{BACKEND_API}/avatars")
             if response.status_code == 200:
-                data = response.json()
+                data = _json(response)
                 self.avatars = {}
                 avatar_list = []
                 
@@ -33,12 +63,7 @@ class DigitalHumanManager:
                     self.avatars[avatar_id] = avatar_info
                     
                     # 构建显示名称
-                    status_emoji = {
-                        "ready": "✅",
-                        "running": "▶️",
-                        "training": "🔄",
-                        "error": "❌"
-                    }.get(avatar_info["status"], "❓")
+                    status_emoji = _STATUS_EMOJI.get(avatar_info["status"], "❓")
                     
                     display_name = f"{status_emoji} {avatar_info['name']}"
                     avatar_list.append((avatar_id, display_name))
@@ -50,14 +75,15 @@ class DigitalHumanManager:
     
     def get_avatar_info(self, avatar_id: str) -> dict:
         """获取数字人信息"""
-        if avatar_id in self.avatars:
-            return self.avatars[avatar_id]
+        info = self.avatars.get(avatar_id)
+        if info is not None:
+            return info
         
         # 尝试从后端获取
         try:
-            response = requests.get(f"{BACKEND_API}/training-status/{avatar_id}")
+            response = SESSION.get(f"{BACKEND_API}/training-status/{avatar_id}")
             if response.status_code == 200:
-                return response.json()
+                return _json(response)
         except:
             pass
         
@@ -67,6 +93,22 @@ class DigitalHumanManager:
 manager = DigitalHumanManager()
 
 # ========== 主要功能函数 ==========
+def _upload(kind: str, file_path: str, mime: str) -> requests.Response:
+    """上传单个文件到后端 /upload/{kind}（文件只打开一次，由同一个句柄完成发送）"""
+    name = os.path.basename(file_path)
+    with open(file_path, "rb") as f:
+        fields = {"file": (name, f, mime)}
+        if MultipartEncoder is None:
+            return SESSION.post(f"{BACKEND_API}/upload/{kind}", files=fields)
+        
+        # 边读边发，避免把整个视频读进内存
+        encoder = MultipartEncoder(fields=fields)
+        return SESSION.post(
+            f"{BACKEND_API}/upload/{kind}",
+            data=encoder,
+            headers={"Content-Type": encoder.content_type}
+        )
+
 def create_or_train_avatar(
     action: str,
     avatar_name: str,
@@ -92,32 +134,24 @@ def create_or_train_avatar(
         return gr.Dropdown(choices=manager.refresh_avatars()), "❌ 音频必须是WAV格式", ""
     
     try:
-        # 1. 上传视频
-        with open(video_file, "rb") as f:
-            response = requests.post(
-                f"{BACKEND_API}/upload/video",
-                files={"file": (os.path.basename(video_file), f, "video/mp4")}
-            )
+        # 1-2. 并发上传视频和音频
+        with ThreadPoolExecutor(max_workers=2) as ex:
+            fv = ex.submit(_upload, "video", video_file, "video/mp4")
+            fa = ex.submit(_upload, "audio", audio_file, "audio/wav")
+            video_response, audio_response = fv.result(), fa.result()
         
-        if response.status_code != 200:
-            error_msg = response.json().get("detail", "视频上传失败")
+        if video_response.status_code != 200:
+            error_msg = _json(video_response).get("detail", "视频上传失败")
             return gr.Dropdown(choices=manager.refresh_avatars()), f"❌ {error_msg}", ""
         
-        video_data = response.json()
+        video_data = _json(video_response)
         video_path = video_data["video_path"]
         
-        # 2. 上传音频
-        with open(audio_file, "rb") as f:
-            response = requests.post(
-                f"{BACKEND_API}/upload/audio",
-                files={"file": (os.path.basename(audio_file), f, "audio/wav")}
-            )
-        
-        if response.status_code != 200:
-            error_msg = response.json().get("detail", "音频上传失败")
+        if audio_response.status_code != 200:
+            error_msg = _json(audio_response).get("detail", "音频上传失败")
             return gr.Dropdown(choices=manager.refresh_avatars()), f"❌ {error_msg}", ""
         
-        audio_data = response.json()
+        audio_data = _json(audio_response)
         audio_path = audio_data["audio_path"]
         
         # 3. 发送训练请求
@@ -129,13 +163,13 @@ def create_or_train_avatar(
             "prompt": prompt or "你是一个友好的数字助手"
         }
         
-        response = requests.post(f"{BACKEND_API}/train", json=train_data)
+        response = SESSION.post(f"{BACKEND_API}/train", json=train_data)
         
         if response.status_code != 200:
-            error_msg = response.json().get("detail", "训练请求失败")
+            error_msg = _json(response).get("detail", "训练请求失败")
             return gr.Dropdown(choices=manager.refresh_avatars()), f"❌ {error_msg}", ""
         
-        result = response.json()
+        result = _json(response)
         avatar_id = result["avatar_id"]
         
         # 启动状态监控
@@ -152,11 +186,13 @@ def create_or_train_avatar(
 
 def monitor_training(avatar_id: str):
     """监控训练状态"""
+    # 指数退避：训练状态变化很慢，轮询间隔从2秒逐步放宽到60秒
+    delay = 2.0
     while True:
         try:
-            response = requests.get(f"{BACKEND_API}/training-status/{avatar_id}")
+            response = SESSION.get(f"{BACKEND_API}/training-status/{avatar_id}")
             if response.status_code == 200:
-                data = response.json()
+                data = _json(response)
                 status = data.get("status", "unknown")
                 
                 if status == "ready":
@@ -173,7 +209,8 @@ def monitor_training(avatar_id: str):
         except:
             pass
         
-        time.sleep(10)  # 每10秒检查一次
+        time.sleep(delay)
+        delay = min(delay * 1.5, 60.0)
 
 def select_avatar(avatar_dropdown: str) -> Tuple[str, str, str]:
     """选择数字人"""
@@ -211,18 +248,10 @@ def start_or_stop_avatar(avatar_dropdown: str, btn_text: str) -> Tuple[str, str,
     else:
         return stop_avatar(avatar_dropdown)
 
-def start_avatar(avatar_id: str) -> Tuple[str, str, str]:
-    """启动数字人"""
-    try:
-        response = requests.post(f"{BACKEND_API}/start", json={"avatar_id": avatar_id})
-        
-        if response.status_code == 200:
-            result = response.json()
-            
-            # WebRTC iframe
-            webrtc_html = f'''
+# WebRTC播放器HTML模板，启动时只需填入PID
+_WEBRTC_HTML_TMPL = '''
             <iframe 
-                src="{WEBRTC_URL}" 
+                src="{webrtc}" 
                 width="100%" 
                 height="600" 
                 frameborder="0"
@@ -230,14 +259,25 @@ def start_avatar(avatar_id: str) -> Tuple[str, str, str]:
                 style="border-radius: 12px; background: #000;">
             </iframe>
             <div style="text-align: center; margin-top: 10px; color: #666;">
-                WebRTC: {WEBRTC_URL} | PID: {result.get('pid', 'N/A')}
+                WebRTC: {webrtc} | PID: {pid}
             </div>
-            '''
+            '''.format
+
+def start_avatar(avatar_id: str) -> Tuple[str, str, str]:
+    """启动数字人"""
+    try:
+        response = SESSION.post(f"{BACKEND_API}/start", json={"avatar_id": avatar_id})
+        
+        if response.status_code == 200:
+            result = _json(response)
+            
+            # WebRTC iframe
+            webrtc_html = _WEBRTC_HTML_TMPL(webrtc=WEBRTC_URL, pid=result.get('pid', 'N/A'))
             
             manager.refresh_avatars()
             return webrtc_html, f"✅ {avatar_id} 已启动", "⏸️ 停止"
         else:
-            error_msg = response.json().get("detail", "启动失败")
+            error_msg = _json(response).get("detail", "启动失败")
             return "", f"❌ {error_msg}", "▶️ 启动"
             
     except Exception as e:
@@ -246,7 +286,7 @@ def start_avatar(avatar_id: str) -> Tuple[str, str, str]:
 def stop_avatar(avatar_id: str) -> Tuple[str, str, str]:
     """停止数字人"""
     try:
-        response = requests.post(f"{BACKEND_API}/stop", json={"avatar_id": avatar_id})
+        response = SESSION.post(f"{BACKEND_API}/stop", json={"avatar_id": avatar_id})
         
         manager.refresh_avatars()
         
@@ -263,13 +303,18 @@ def refresh_avatar_list() -> gr.Dropdown:
     avatar_list = manager.refresh_avatars()
     return gr.Dropdown(choices=avatar_list)
 
+_health_cache = {"t": 0.0, "v": ""}
+
 def check_backend_health() -> str:
     """检查后端状态"""
+    if time.monotonic() - _health_cache["t"] < HEALTH_CACHE_TTL:
+        return _health_cache["v"]
+    
     try:
-        response = requests.get(f"{BACKEND_API}/health", timeout=2)
+        response = SESSION.get(f"{BACKEND_API}/health", timeout=2)
         if response.status_code == 200:
-            data = response.json()
-            return f"""
+            data = _json(response)
+            result = f"""
 🟢 后端状态: {data['status']}
 LiveTalking路径: {'✅' if data['livetalking_path'] else '❌'}
 数字人目录: {'✅' if data['avatars_dir'] else '❌'}
@@ -278,8 +323,14 @@ LiveTalking路径: {'✅' if data['livetalking_path'] else '❌'}
 运行中: {data['running']} 个
 训练中: {data['training']} 个
 """
+        else:
+            result = None
     except:
-        return "🔴 后端未连接"
+        result = "🔴 后端未连接"
+    
+    _health_cache["t"] = time.monotonic()
+    _health_cache["v"] = result
+    return result
 
 # 自定义CSS
 custom_css = """
@@ -335,7 +386,7 @@ with gr.Blocks(title="LiveTalking数字人系统", css=custom_css, theme=gr.them
                 
                 avatar_dropdown = gr.Dropdown(
                     label="已有数字人",
-                    choices=manager.refresh_avatars(),
+                    choices=[],
                     interactive=True
                 )
                 
@@ -473,6 +524,12 @@ with gr.Blocks(title="LiveTalking数字人系统", css=custom_css, theme=gr.them
         outputs=[video_output, status_text, start_stop_btn]
     )
     
+    # 页面加载时拉取数字人列表
+    app.load(
+        fn=refresh_avatar_list,
+        outputs=[avatar_dropdown]
+    )
+    
     # 定时刷新
     timer = gr.Timer(value=10)
     timer.tick(
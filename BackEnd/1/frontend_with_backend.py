@@ -1,19 +1,97 @@
 import gradio as gr
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+try:
+    from requests_toolbelt import MultipartEncoder
+except ImportError:
+    MultipartEncoder = None
+try:
+    import orjson
+except ImportError:
+    orjson = None
 import json
 import time
 import threading
+from collections import deque
 from datetime import datetime
 from typing import Dict, List, Optional, Tuple
 from pathlib import Path
 import os
+import re
+import mimetypes
 
 # ========== 配置 ==========
 BACKEND_API = "http://localhost:8000"
 WEBRTC_URL = "http://localhost:8010"  # LiveTalking WebRTC地址
+DEFAULT_TIMEOUT = (1.0, 10.0)  # (连接超时, 读取超时)
+TRAIN_TIMEOUT = (1.0, 600.0)  # 创建会话时后端要保存上传文件并用ffmpeg生成视频
+CHAT_HISTORY_LIMIT = 200  # 每个会话最多保留的聊天记录条数
+AVATAR_ID_RE = re.compile(r"^[A-Za-z0-9_]{1,32}$")  # Avatar ID格式
+MAX_NAME_LENGTH = 64  # 数字人名称最大长度
+MAX_UPLOAD_SIZE = 50 * 1024 * 1024  # 单个上传文件大小上限（50MB）
+HANDLER_CONCURRENCY = 16  # 每个事件允许同时执行的回调数（回调基本都在等待HTTP响应）
+
+class _TimeoutSession(requests.Session):
+    """未显式指定timeout时使用默认超时，避免请求卡死工作线程"""
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", DEFAULT_TIMEOUT)
+        # 有orjson时用它序列化请求体
+        if orjson is not None and kwargs.get("json") is not None:
+            kwargs["data"] = orjson.dumps(kwargs.pop("json"))
+            kwargs["headers"] = {**(kwargs.get("headers") or {}), "Content-Type": "application/json"}
+        return super().request(method, url, **kwargs)
+
+# JSON解析，优先使用orjson
+_loads = orjson.loads if orjson is not None else json.loads
+
+def _json(response: requests.Response):
+    """解析后端JSON响应"""
+    return _loads(response.content)
+
+# 全局复用的HTTP会话，保持到后端的长连接
+SESSION = _TimeoutSession()
+SESSION.mount("http://", HTTPAdapter(
+    pool_connections=16,
+    pool_maxsize=64,
+    # POST不幂等（上传、训练、启动），只重试GET/DELETE
+    max_retries=Retry(
+        total=2,
+        backoff_factor=0.1,
+        allowed_methods=["GET", "DELETE"],
+        status_forcelist=[502, 503, 504]
+    )
+))
+SESSION.headers.update({"Connection": "keep-alive"})
+
+# 会话状态对应的显示图标
+STATUS_EMOJI = {
+    "idle": "⚫",
+    "training": "🔄",
+    "ready": "✅",
+    "running": "▶️",
+    "error": "❌"
+}
+
+# 开始/停止按钮文字：运行中一律显示停止，否则按会话状态选择，error和未知状态显示错误
+BTN_STOP_TEXT = "⏸️ 停止"
+BTN_TEXT = {
+    "ready": "▶️ 开始运行",
+    "idle": "▶️ 开始运行",
+    "training": "⏳ 训练中..."
+}
+
+# 切换会话时显示的状态信息
+STATUS_TEMPLATE = "当前会话: {name}\nAvatar ID: {avatar}\n状态: {status}\n参考文本: {ref}...\n{pid_line}"
 
 class DigitalHumanSession:
     """数字人会话管理类"""
+    __slots__ = (
+        "session_id", "name", "avatar_id", "_ref_text", "ref_text_short", "prompt", "status",
+        "chat_history", "image_path", "audio_path", "video_path",
+        "creation_time", "is_running", "pid"
+    )
+    
     def __init__(self, session_id: str, name: str):
         self.session_id = session_id
         self.name = name
@@ -21,19 +99,35 @@ class DigitalHumanSession:
         self.ref_text = ""
         self.prompt = ""
         self.status = "idle"
-        self.chat_history = []
+        self.chat_history = deque(maxlen=CHAT_HISTORY_LIMIT)
         self.image_path = None
         self.audio_path = None
         self.video_path = None
         self.creation_time = datetime.now()
         self.is_running = False
         self.pid = None
+    
+    @property
+    def ref_text(self) -> str:
+        return self._ref_text
+    
+    @ref_text.setter
+    def ref_text(self, value: str):
+        # 同时缓存状态信息中显示的截断文本
+        self._ref_text = value
+        self.ref_text_short = value[:50]
         
 class DigitalHumanManager:
     """数字人管理器"""
     def __init__(self):
         self.sessions: Dict[str, DigitalHumanSession] = {}
         self.current_session_id = None
+        self.lock = threading.Lock()  # 状态监听线程与界面回调共享sessions
+        self._list_cache: List[Tuple[str, str]] = []
+        self._cache_dirty = True
+        self._list_generation = 0  # 会话列表每重建一次加1
+        self._dropdown: Optional[dict] = None
+        self._dropdown_generation = -1
         
     def create_session(self, session_id: str, name: str, avatar_id: str, ref_text: str, prompt: str) -> DigitalHumanSession:
         """创建新的数字人会话"""
@@ -42,22 +136,50 @@ class DigitalHumanManager:
         session.ref_text = ref_text
         session.prompt = prompt
         session.status = "training"
-        self.sessions[session_id] = session
+        self.add_session(session)
         return session
     
+    def get(self, session_id: Optional[str]) -> Optional[DigitalHumanSession]:
+        """按ID获取会话，不存在时返回None"""
+        return self.sessions.get(session_id) if session_id else None
+    
+    def add_session(self, session: DigitalHumanSession):
+        """加入会话"""
+        with self.lock:
+            self.sessions[session.session_id] = session
+            self._cache_dirty = True
+    
+    def delete_session(self, session_id: str):
+        """移除会话"""
+        with self.lock:
+            if self.sessions.pop(session_id, None) is not None:
+                self._cache_dirty = True
+    
+    def set_status(self, session: DigitalHumanSession, status: str):
+        """更新会话状态（状态会显示在会话列表中）"""
+        if session.status != status:
+            session.status = status
+            self._cache_dirty = True
+    
     def get_session_list(self) -> List[Tuple[str, str]]:
-        """获取会话列表"""
-        result = []
-        for sid, s in self.sessions.items():
-            status_emoji = {
-                "idle": "⚫",
-                "training": "🔄",
-                "ready": "✅",
-                "running": "▶️",
-                "error": "❌"
-            }.get(s.status, "❓")
-            result.append((sid, f"{status_emoji} {s.name} ({s.avatar_id})"))
-        return result
+        """获取会话列表（仅在会话或状态变化后重建）"""
+        if self._cache_dirty:
+            with self.lock:
+                self._cache_dirty = False
+                self._list_cache = [
+                    (sid, f"{STATUS_EMOJI.get(s.status, '❓')} {s.name} ({s.avatar_id})")
+                    for sid, s in self.sessions.items()
+                ]
+                self._list_generation += 1
+        return self._list_cache
+    
+    def get_dropdown_cached(self) -> dict:
+        """获取会话下拉框更新，列表未变化时复用同一个对象"""
+        choices = self.get_session_list()
+        if self._dropdown_generation != self._list_generation:
+            self._dropdown = gr.update(choices=choices)
+            self._dropdown_generation = self._list_generation
+        return self._dropdown
     
     def switch_session(self, session_id: str) -> bool:
         """切换会话"""
@@ -72,67 +194,69 @@ class DigitalHumanManager:
             session = self.sessions[self.current_session_id]
             if session.is_running:
                 try:
-                    requests.post(f"{BACKEND_API}/stop", json={"session_id": self.current_session_id})
+                    SESSION.post(f"{BACKEND_API}/stop", json={"session_id": self.current_session_id})
                     session.is_running = False
-                except:
-                    pass
+                except (requests.Timeout, requests.ConnectionError) as e:
+                    print(f"停止会话失败: {e}")
 
 # 创建全局管理器实例
 manager = DigitalHumanManager()
 
 # ========== 主要功能函数 ==========
-def create_new_session(name: str, avatar_id: str, image_file, audio_file, ref_text: str, prompt: str) -> Tuple[gr.Dropdown, str, str]:
+def _create_on_backend(fields: dict, image_file: str, audio_file: str) -> requests.Response:
+    """一次请求流式上传图片、音频并提交训练"""
+    with open(image_file, "rb") as image_f, open(audio_file, "rb") as audio_f:
+        files = {
+            "image": (os.path.basename(image_file), image_f, mimetypes.guess_type(image_file)[0] or "image/jpeg"),
+            "audio": (os.path.basename(audio_file), audio_f, mimetypes.guess_type(audio_file)[0] or "audio/wav")
+        }
+        if MultipartEncoder is None:
+            return SESSION.post(f"{BACKEND_API}/create_session", data=fields, files=files, timeout=TRAIN_TIMEOUT)
+        
+        encoder = MultipartEncoder(fields={**fields, **files})
+        return SESSION.post(
+            f"{BACKEND_API}/create_session",
+            data=encoder,
+            headers={"Content-Type": encoder.content_type},
+            timeout=TRAIN_TIMEOUT
+        )
+
+def create_new_session(name: str, avatar_id: str, image_file, audio_file, ref_text: str, prompt: str) -> Tuple[dict, str, str]:
     """创建新的数字人会话"""
-    
     # 验证必填字段
     if not all([name, avatar_id, image_file, audio_file, ref_text]):
-        return gr.Dropdown(choices=manager.get_session_list()), "❌ 请填写所有必填字段", ""
+        return manager.get_dropdown_cached(), "❌ 请填写所有必填字段", ""
+    
+    # 本地校验，避免格式错误时仍上传文件
+    if not AVATAR_ID_RE.match(avatar_id):
+        return manager.get_dropdown_cached(), "❌ Avatar ID 格式错误（仅限英文字母、数字和下划线，最多32位）", ""
+    
+    if len(name) > MAX_NAME_LENGTH:
+        return manager.get_dropdown_cached(), f"❌ 数字人名称不能超过{MAX_NAME_LENGTH}个字符", ""
+    
+    for file_path in (image_file, audio_file):
+        if os.path.getsize(file_path) > MAX_UPLOAD_SIZE:
+            return manager.get_dropdown_cached(), f"❌ 文件过大: {os.path.basename(file_path)}（上限50MB）", ""
     
     try:
-        # 1. 上传图片并生成视频
-        with open(image_file, "rb") as f:
-            response = requests.post(
-                f"{BACKEND_API}/upload/image",
-                files={"file": (os.path.basename(image_file), f, "image/jpeg")}
-            )
-        
-        if response.status_code != 200:
-            return gr.Dropdown(choices=manager.get_session_list()), "❌ 图片上传失败", ""
-        
-        image_data = response.json()
-        video_path = image_data["video_path"]
-        image_path = image_data["image_path"]
-        
-        # 2. 上传音频
-        with open(audio_file, "rb") as f:
-            response = requests.post(
-                f"{BACKEND_API}/upload/audio",
-                files={"file": (os.path.basename(audio_file), f, "audio/wav")}
-            )
-        
-        if response.status_code != 200:
-            return gr.Dropdown(choices=manager.get_session_list()), "❌ 音频上传失败", ""
-        
-        audio_data = response.json()
-        audio_path = audio_data["audio_path"]
-        
-        # 3. 发送训练请求
-        train_data = {
+        # 1-3. 上传图片（后端生成视频）、上传音频、发送训练请求，合并为一次请求
+        fields = {
             "session_id": avatar_id,  # 使用avatar_id作为session_id
             "avatar_id": f"wav2lip256_{avatar_id}",  # 添加前缀
-            "video_path": video_path,
-            "audio_path": audio_path,
             "ref_text": ref_text,
             "prompt": prompt or "你是一个友好的数字助手"
         }
         
-        response = requests.post(f"{BACKEND_API}/train", json=train_data)
+        response = _create_on_backend(fields, image_file, audio_file)
         
         if response.status_code != 200:
-            return gr.Dropdown(choices=manager.get_session_list()), f"❌ 训练请求失败: {response.text}", ""
+            return manager.get_dropdown_cached(), f"❌ 创建失败: {response.text}", ""
         
-        result = response.json()
+        result = _json(response)
         session_id = result["session_id"]
+        image_path = result["image_path"]
+        audio_path = result["audio_path"]
+        video_path = result["video_path"]
         
         # 4. 创建本地会话
         session = manager.create_session(session_id, name, avatar_id, ref_text, prompt)
@@ -140,123 +264,172 @@ def create_new_session(name: str, avatar_id: str, image_file, audio_file, ref_te
         session.audio_path = audio_path
         session.video_path = video_path
         
-        # 5. 启动状态监控线程
-        threading.Thread(target=monitor_training, args=(session_id,), daemon=True).start()
+        # 5. 确保状态监听线程已启动
+        ensure_session_watcher()
         
         return (
-            gr.Dropdown(choices=manager.get_session_list(), value=session_id),
+            gr.update(choices=manager.get_session_list(), value=session_id),
             f"✅ 创建成功！正在训练数字人 '{avatar_id}'，预计需要5-10分钟...",
             ""
         )
         
     except Exception as e:
-        return gr.Dropdown(choices=manager.get_session_list()), f"❌ 创建失败: {str(e)}", ""
-
-def monitor_training(session_id: str):
-    """监控训练状态"""
-    session = manager.sessions[session_id]
-    
-    while session.status == "training":
-        try:
-            response = requests.get(f"{BACKEND_API}/session/{session_id}")
-            if response.status_code == 200:
-                data = response.json()
-                session.status = data["status"]
-                
-                if session.status == "ready":
-                    print(f"✅ 训练完成: {session_id}")
-                elif session.status == "error":
-                    print(f"❌ 训练失败: {session_id}")
-                    if "error" in data:
-                        print(f"错误信息: {data['error']}")
-        except:
-            pass
+        return manager.get_dropdown_cached(), f"❌ 创建失败: {str(e)}", ""
+
+def _apply_status(data: dict):
+    """将后端推送或查询到的状态写回本地会话"""
+    session_id = data.get("session_id")
+    with manager.lock:
+        session = manager.sessions.get(session_id)
+        if session is None:
+            return
+        old_status = session.status
+        manager.set_status(session, data.get("status", old_status))
+        session.pid = data.get("pid")
+    
+    if session.status == old_status:
+        return
+    if session.status == "ready" and old_status == "training":
+        print(f"✅ 训练完成: {session_id}")
+    elif session.status == "error":
+        print(f"❌ 训练失败: {session_id}")
+        if data.get("error"):
+            print(f"错误信息: {data['error']}")
+
+def _has_training() -> bool:
+    """是否还有训练中的会话"""
+    with manager.lock:
+        return any(s.status == "training" for s in manager.sessions.values())
+
+def _poll_training_sessions():
+    """后端不支持SSE时，用一次 /sessions 请求更新所有训练中的会话"""
+    if not _has_training():
+        return
+    try:
+        response = SESSION.get(f"{BACKEND_API}/sessions")
+        if response.status_code == 200:
+            for session_data in _json(response)["sessions"]:
+                _apply_status(session_data)
+    except (requests.Timeout, requests.ConnectionError) as e:
+        print(f"查询训练状态失败: {e}")
+
+_watcher_lock = threading.Lock()
+_watcher: Optional[threading.Thread] = None
+
+def _stop_watching_if_idle() -> bool:
+    """没有训练中的会话时注销监听线程，返回是否应退出"""
+    global _watcher
+    with _watcher_lock:
+        if _has_training():
+            return False
+        _watcher = None
+        return True
+
+def watch_sessions():
+    """监听所有训练中会话的状态变化（全局只有一个线程，训练全部结束后退出）"""
+    sse_supported = True
+    while not _stop_watching_if_idle():
+        if sse_supported:
+            try:
+                with SESSION.get(f"{BACKEND_API}/events", stream=True, timeout=(2, None)) as response:
+                    if response.status_code == 200:
+                        # 后端每15秒发送一次keepalive，保证能及时检查是否该退出
+                        for line in response.iter_lines(decode_unicode=True):
+                            if line and line.startswith("data:"):
+                                _apply_status(_loads(line[5:]))
+                            if _stop_watching_if_idle():
+                                return
+                    elif response.status_code == 404:
+                        sse_supported = False
+            except requests.RequestException as e:
+                print(f"状态推送连接断开: {e}")
         
-        time.sleep(5)  # 每5秒检查一次
+        # SSE不可用或连接断开时，退化为单个合并轮询
+        _poll_training_sessions()
+        time.sleep(5)
+
+def ensure_session_watcher():
+    """按需启动状态监听线程"""
+    global _watcher
+    with _watcher_lock:
+        if _watcher is None:
+            _watcher = threading.Thread(target=watch_sessions, daemon=True)
+            _watcher.start()
 
-def switch_session(session_id: str) -> Tuple[list, str, str, str, str, str]:
+# 未选择有效会话时各回调的返回值
+_NO_SESSION_SWITCH = ([], "▶️ 开始运行", "请选择有效的会话", "")
+_NO_SESSION_START = ("", "请先选择会话", "▶️ 开始运行")
+_NO_SESSION_STOP = ("未找到会话", "▶️ 开始运行")
+
+def switch_session(session_id: str) -> Tuple[list, str, str, str]:
     """切换到指定会话"""
-    if not session_id or session_id not in manager.sessions:
-        return [], "", "", "▶️ 开始运行", "请选择有效的会话", ""
+    session = manager.get(session_id)
+    if session is None:
+        return _NO_SESSION_SWITCH
     
     manager.switch_session(session_id)
-    session = manager.sessions[session_id]
     
     # 获取最新状态
     try:
-        response = requests.get(f"{BACKEND_API}/session/{session_id}")
+        response = SESSION.get(f"{BACKEND_API}/session/{session_id}")
         if response.status_code == 200:
-            data = response.json()
-            session.status = data["status"]
+            data = _json(response)
+            manager.set_status(session, data["status"])
             session.is_running = data.get("is_running", False)
             session.pid = data.get("pid")
-    except:
-        pass
+    except (requests.Timeout, requests.ConnectionError) as e:
+        print(f"获取会话状态失败: {e}")
     
     # 构建状态信息
-    status_info = f"""
-当前会话: {session.name}
-Avatar ID: {session.avatar_id}
-状态: {session.status}
-参考文本: {session.ref_text[:50]}...
-"""
-    if session.pid:
-        status_info += f"进程PID: {session.pid}"
+    status_info = STATUS_TEMPLATE.format(
+        name=session.name,
+        avatar=session.avatar_id,
+        status=session.status,
+        ref=session.ref_text_short,
+        pid_line=f"进程PID: {session.pid}" if session.pid else ""
+    )
     
     # 根据状态设置按钮
-    if session.is_running:
-        btn_text = "⏸️ 停止"
-    elif session.status == "ready":
-        btn_text = "▶️ 开始运行"
-    elif session.status == "training":
-        btn_text = "⏳ 训练中..."
-    else:
-        btn_text = "❌ 错误"
+    btn_text = BTN_STOP_TEXT if session.is_running else BTN_TEXT.get(session.status, "❌ 错误")
     
     return (
-        session.chat_history,
-        session.prompt,
-        session.ref_text,
+        list(session.chat_history),
         btn_text,
         status_info,
         ""
     )
 
+# WebRTC播放器HTML模板
+WEBRTC_TEMPLATE = (
+    '<iframe src="{url}" width="100%" height="600" frameborder="0" '
+    'allow="camera; microphone; display-capture" '
+    'style="border-radius: 12px; background: #000;"></iframe>'
+    '<div style="text-align: center; margin-top: 10px; color: #666;">'
+    'WebRTC连接: {url} | PID: {pid}</div>'
+).format
+
 def start_digital_human(session_id: str) -> Tuple[str, str, str]:
     """启动数字人视频输出"""
-    if not session_id or session_id not in manager.sessions:
-        return "", "请先选择会话", "▶️ 开始运行"
-    
-    session = manager.sessions[session_id]
+    session = manager.get(session_id)
+    if session is None:
+        return _NO_SESSION_START
     
     try:
         # 发送启动请求
-        response = requests.post(f"{BACKEND_API}/start", json={"session_id": session_id})
+        response = SESSION.post(f"{BACKEND_API}/start", json={"session_id": session_id})
         
         if response.status_code == 200:
-            result = response.json()
+            result = _json(response)
             session.is_running = True
-            session.status = "running"
+            manager.set_status(session, "running")
             session.pid = result.get("pid")
             
             # 生成WebRTC iframe
-            webrtc_html = f'''
-            <iframe 
-                src="{WEBRTC_URL}" 
-                width="100%" 
-                height="600" 
-                frameborder="0"
-                allow="camera; microphone; display-capture"
-                style="border-radius: 12px; background: #000;">
-            </iframe>
-            <div style="text-align: center; margin-top: 10px; color: #666;">
-                WebRTC连接: {WEBRTC_URL} | PID: {session.pid}
-            </div>
-            '''
+            webrtc_html = WEBRTC_TEMPLATE(url=WEBRTC_URL, pid=session.pid)
             
             return webrtc_html, f"✅ 数字人已启动 (PID: {session.pid})", "⏸️ 停止"
         else:
-            error_msg = response.json().get("detail", "未知错误")
+            error_msg = _json(response).get("detail", "未知错误")
             return "", f"❌ 启动失败: {error_msg}", "▶️ 开始运行"
             
     except Exception as e:
@@ -264,45 +437,44 @@ def start_digital_human(session_id: str) -> Tuple[str, str, str]:
 
 def stop_digital_human(session_id: str) -> Tuple[str, str]:
     """停止数字人视频输出"""
-    if session_id and session_id in manager.sessions:
-        try:
-            response = requests.post(f"{BACKEND_API}/stop", json={"session_id": session_id})
-            
-            session = manager.sessions[session_id]
-            session.is_running = False
-            session.status = "ready"
-            session.pid = None
-            
-            if response.status_code == 200:
-                return "✅ 已停止", "▶️ 开始运行"
-            else:
-                return "⚠️ 停止请求已发送", "▶️ 开始运行"
-                
-        except Exception as e:
-            return f"❌ 停止失败: {str(e)}", "▶️ 开始运行"
+    session = manager.get(session_id)
+    if session is None:
+        return _NO_SESSION_STOP
     
-    return "未找到会话", "▶️ 开始运行"
+    try:
+        response = SESSION.post(f"{BACKEND_API}/stop", json={"session_id": session_id})
+        
+        session.is_running = False
+        manager.set_status(session, "ready")
+        session.pid = None
+        
+        if response.status_code == 200:
+            return "✅ 已停止", "▶️ 开始运行"
+        else:
+            return "⚠️ 停止请求已发送", "▶️ 开始运行"
+            
+    except Exception as e:
+        return f"❌ 停止失败: {str(e)}", "▶️ 开始运行"
 
 def send_message(message: str, chat_history: list, session_id: str) -> Tuple[list, str, str]:
     """发送消息到数字人"""
-    if not session_id or session_id not in manager.sessions:
+    session = manager.get(session_id)
+    if session is None:
         return chat_history, "", "❌ 请先选择会话"
     
-    session = manager.sessions[session_id]
-    
     if not session.is_running:
         return chat_history, "", "⚠️ 数字人未运行，请先启动"
     
     if not message.strip():
         return chat_history, "", ""
     
-    # 添加到聊天历史
-    chat_history.append([message, "（数字人回复将通过视频展示）"])
-    session.chat_history = chat_history
+    # 添加到聊天历史（超出上限时丢弃最早的记录）
+    session.chat_history.append([message, "（数字人回复将通过视频展示）"])
+    chat_history = list(session.chat_history)
     
     # 发送到后端（虽然实际对话通过WebRTC）
     try:
-        requests.post(f"{BACKEND_API}/chat", json={
+        SESSION.post(f"{BACKEND_API}/chat", json={
             "session_id": session_id,
             "message": message
         })
@@ -312,51 +484,98 @@ def send_message(message: str, chat_history: list, session_id: str) -> Tuple[lis
     
     return chat_history, "", status
 
-def refresh_sessions() -> Tuple[gr.Dropdown, str]:
+_status_cache: Tuple[float, Optional[dict]] = (0.0, None)
+
+def _fetch_status(cache_ttl: float = 1.0) -> dict:
+    """获取后端 /status（健康信息+会话列表），短时间内的重复调用共享同一次请求"""
+    global _status_cache
+    fetched_at, payload = _status_cache
+    if payload is not None and time.monotonic() - fetched_at < cache_ttl:
+        return payload
+    
+    response = SESSION.get(f"{BACKEND_API}/status", timeout=2)
+    response.raise_for_status()
+    payload = _json(response)
+    _status_cache = (time.monotonic(), payload)
+    return payload
+
+def _sync_sessions(session_list: List[dict]):
+    """用后端会话列表更新本地会话状态"""
+    for session_data in session_list:
+        sid = session_data["session_id"]
+        if sid not in manager.sessions:
+            # 创建新会话对象
+            session = DigitalHumanSession(sid, sid)
+            session.avatar_id = session_data.get("avatar_id", "")
+            session.ref_text = session_data.get("ref_text", "")
+            session.prompt = session_data.get("prompt", "")
+            manager.add_session(session)
+        
+        # 更新状态
+        manager.set_status(manager.sessions[sid], session_data["status"])
+
+def refresh_sessions() -> Tuple[dict, str]:
     """刷新会话列表和状态"""
     try:
-        response = requests.get(f"{BACKEND_API}/sessions")
-        if response.status_code == 200:
-            data = response.json()
-            
-            # 更新本地会话状态
-            for session_data in data["sessions"]:
-                sid = session_data["session_id"]
-                if sid not in manager.sessions:
-                    # 创建新会话对象
-                    session = DigitalHumanSession(sid, sid)
-                    session.avatar_id = session_data.get("avatar_id", "")
-                    session.ref_text = session_data.get("ref_text", "")
-                    session.prompt = session_data.get("prompt", "")
-                    manager.sessions[sid] = session
-                
-                # 更新状态
-                manager.sessions[sid].status = session_data["status"]
-            
-            return gr.Dropdown(choices=manager.get_session_list()), f"已刷新 ({len(manager.sessions)} 个会话)"
+        _sync_sessions(_fetch_status()["sessions"])
+        return manager.get_dropdown_cached(), f"已刷新 ({len(manager.sessions)} 个会话)"
     except Exception as e:
-        return gr.Dropdown(choices=manager.get_session_list()), f"刷新失败: {str(e)}"
-    
-    return gr.Dropdown(choices=manager.get_session_list()), ""
+        return manager.get_dropdown_cached(), f"刷新失败: {str(e)}"
 
-def check_backend_health() -> str:
-    """检查后端健康状态"""
-    try:
-        response = requests.get(f"{BACKEND_API}/health", timeout=2)
-        if response.status_code == 200:
-            data = response.json()
-            return f"""
+def _format_health(data: dict) -> str:
+    """格式化健康信息"""
+    return f"""
 🟢 后端状态: {data['status']}
 LiveTalking: {'✅' if data['livetalking'] else '❌'}
 会话总数: {data['sessions']}
 运行中: {data['running']}
 训练中: {data['training']}
 """
-        else:
-            return "🔴 后端响应异常"
+
+def check_backend_health() -> str:
+    """检查后端健康状态"""
+    try:
+        return _format_health(_fetch_status()["health"])
+    except requests.HTTPError:
+        return "🔴 后端响应异常"
     except:
         return "🔴 后端未连接"
 
+# 定时刷新退避状态：状态稳定时逐步拉长实际请求间隔（最多每8次tick请求一次）
+# 退避状态保存在每个浏览器会话的gr.State中，各标签页的定时器互不影响
+MAX_POLL_INTERVAL = 8
+POLL_STATE_INIT = {"interval": 1, "countdown": 0, "last_hash": None}
+
+def reset_poll_backoff(poll: dict) -> dict:
+    """用户操作后恢复每次tick都刷新"""
+    return {**poll, "interval": 1, "countdown": 0}
+
+def refresh_status(poll: dict) -> Tuple[str, dict, dict]:
+    """定时刷新：一次请求同时更新健康状态和会话列表"""
+    if poll["countdown"] > 0:
+        return gr.update(), gr.update(), {**poll, "countdown": poll["countdown"] - 1}
+    
+    try:
+        payload = _fetch_status()
+    except requests.HTTPError:
+        return "🔴 后端响应异常", manager.get_dropdown_cached(), reset_poll_backoff(poll)
+    except:
+        return "🔴 后端未连接", manager.get_dropdown_cached(), reset_poll_backoff(poll)
+    
+    health = payload["health"]
+    state_hash = hash((
+        health["status"], health["sessions"], health["running"], health["training"],
+        tuple((s["session_id"], s["status"]) for s in payload["sessions"])
+    ))
+    if state_hash == poll["last_hash"]:
+        interval = min(poll["interval"] * 2, MAX_POLL_INTERVAL)
+    else:
+        interval = 1
+    poll = {"interval": interval, "countdown": interval - 1, "last_hash": state_hash}
+    
+    _sync_sessions(payload["sessions"])
+    return _format_health(health), manager.get_dropdown_cached(), poll
+
 # 自定义CSS样式
 custom_css = """
 .container {
@@ -394,7 +613,7 @@ with gr.Blocks(title="LiveTalking数字人系统", css=custom_css, theme=gr.them
                 gr.Markdown("### 🔌 系统状态")
                 backend_status = gr.Textbox(
                     label="",
-                    value=check_backend_health(),
+                    value="⏳ 正在连接后端...",
                     interactive=False,
                     lines=5
                 )
@@ -500,9 +719,8 @@ with gr.Blocks(title="LiveTalking数字人系统", css=custom_css, theme=gr.them
                 interactive=False
             )
     
-    # 显示当前会话的参考文本
-    ref_text_display = gr.Textbox(visible=False)
-    prompt_display = gr.Textbox(visible=False)
+    # 每个浏览器会话独立的定时刷新退避状态
+    poll_state = gr.State(POLL_STATE_INIT)
     
     # 事件绑定
     create_btn.click(
@@ -514,7 +732,7 @@ with gr.Blocks(title="LiveTalking数字人系统", css=custom_css, theme=gr.them
     switch_btn.click(
         fn=switch_session,
         inputs=[session_dropdown],
-        outputs=[chatbot, prompt_display, ref_text_display, start_stop_btn, status_text, video_output]
+        outputs=[chatbot, start_stop_btn, status_text, video_output]
     )
     
     refresh_btn.click(
@@ -546,13 +764,12 @@ with gr.Blocks(title="LiveTalking数字人系统", css=custom_css, theme=gr.them
     def delete_session(session_id):
         if session_id:
             try:
-                response = requests.delete(f"{BACKEND_API}/session/{session_id}")
-                if session_id in manager.sessions:
-                    del manager.sessions[session_id]
-                return gr.Dropdown(choices=manager.get_session_list()), "✅ 已删除"
+                response = SESSION.delete(f"{BACKEND_API}/session/{session_id}")
+                manager.delete_session(session_id)
+                return manager.get_dropdown_cached(), "✅ 已删除"
             except:
-                return gr.Dropdown(choices=manager.get_session_list()), "❌ 删除失败"
-        return gr.Dropdown(choices=manager.get_session_list()), ""
+                return manager.get_dropdown_cached(), "❌ 删除失败"
+        return manager.get_dropdown_cached(), ""
     
     delete_btn.click(
         fn=delete_session,
@@ -573,13 +790,31 @@ with gr.Blocks(title="LiveTalking数字人系统", css=custom_css, theme=gr.them
         outputs=[chatbot, msg_input, chat_status]
     )
     
+    # 页面加载后再做首次健康检查，不阻塞界面构建
+    app.load(
+        fn=check_backend_health,
+        outputs=[backend_status]
+    )
+    
+    # 用户操作后恢复每次tick都刷新
+    for btn in (create_btn, switch_btn, start_stop_btn, delete_btn):
+        btn.click(
+            fn=reset_poll_backoff,
+            inputs=[poll_state],
+            outputs=[poll_state]
+        )
+    
     # 定时刷新状态
     timer = gr.Timer(value=5)
     timer.tick(
-        fn=check_backend_health,
-        outputs=[backend_status]
+        fn=refresh_status,
+        inputs=[poll_state],
+        outputs=[backend_status, session_dropdown, poll_state]
     )
 
+# Gradio默认每个事件同一时间只执行一个回调，I/O等待会让其他用户排队
+app.queue(default_concurrency_limit=HANDLER_CONCURRENCY)
+
 if __name__ == "__main__":
     print("""
     ╔══════════════════════════════════════════════════════╗
@@ -3,8 +3,8 @@ LiveTalking 后端API服务 - Windows版本
 管理数字人的训练和运行
 """
 
-from fastapi import FastAPI, HTTPException, BackgroundTasks, File, UploadFile
-from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi import FastAPI, HTTPException, BackgroundTasks, File, UploadFile, Form
+from fastapi.responses import StreamingResponse, JSONResponse, ORJSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 import uvicorn
@@ -15,43 +15,89 @@ import os
 import time
 import asyncio
 import logging
+import logging.handlers
+import queue
+import sqlite3
 from typing import Dict, Optional, List
 from pathlib import Path
 import signal
 import shutil
+import hashlib
+import ctypes
+import uuid
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 import psutil  # 需要安装: pip install psutil
 
+try:
+    import win32api  # 可选（Windows）: pip install pywin32
+    import win32con
+    import win32job
+except ImportError:
+    win32job = None
+
+try:
+    import orjson  # 可选: pip install orjson
+except ImportError:
+    orjson = None
+
 # ==================== 配置部分 ====================
 # LiveTalking项目路径
 LIVETALKING_PATH = r"D:\Projects\See You Again\src\LiveTalking\LiveTalking-main"
 WAV2LIP_PATH = os.path.join(LIVETALKING_PATH, "wav2lip")
+LIVETALKING_DIR = Path(LIVETALKING_PATH)
+APP_PY = LIVETALKING_DIR / "app.py"
+GENAVATAR_PY = Path(WAV2LIP_PATH) / "genavatar.py"
+INSTALL_CHECK_TTL = 60  # 安装检查结果缓存时间（秒）
 
 # TTS服务器配置
 TTS_SERVER = "http://127.0.0.1:50000"
 
+# LiveTalking WebRTC端口，启动后探测该端口判断是否就绪
+LIVETALKING_PORT = 8010
+START_CHECK_TIMEOUT = 2.0  # 启动检查最长等待时间（秒）
+START_MIN_WAIT = 1.0  # 端口可连接后至少等待的时间（秒），确认进程没有因端口占用退出
+PUMP_CHUNK_SIZE = 64 * 1024  # 子进程输出每次读取的字节数
+
 # 文件存储路径
 UPLOAD_DIR = Path("uploads")
 MODELS_DIR = Path("models")
 LOGS_DIR = Path("logs")
+STATE_DB = Path("state.db")  # 会话状态持久化（重启后恢复）
+UPLOAD_CHUNK_SIZE = 1 << 20  # 上传文件分块写入大小（1MB）
+
+# 线程池与并发上限，避免突发请求同时拉起过多线程和ffmpeg
+THREAD_LIMIT = min(8, os.cpu_count() or 1)  # FastAPI(anyio)同步线程池上限
+BG_WORKERS = 4  # 事件循环默认线程池/并发ffmpeg数量
 
 # 创建必要的目录
 for dir_path in [UPLOAD_DIR, MODELS_DIR, LOGS_DIR]:
     dir_path.mkdir(exist_ok=True, parents=True)
 
-# 配置日志
+# 配置日志：请求路径只入队，由后台监听线程负责写文件和控制台
+_log_queue = queue.SimpleQueue()
+_log_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+_log_handlers = [
+    logging.FileHandler(LOGS_DIR / "backend.log"),
+    logging.StreamHandler()
+]
+for _handler in _log_handlers:
+    _handler.setFormatter(_log_formatter)
+
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(LOGS_DIR / "backend.log"),
-        logging.StreamHandler()
-    ]
+    handlers=[logging.handlers.QueueHandler(_log_queue)]
 )
+_log_listener = logging.handlers.QueueListener(_log_queue, *_log_handlers)
+_log_listener.start()
 logger = logging.getLogger(__name__)
 
 # ==================== FastAPI初始化 ====================
-app = FastAPI(title="LiveTalking 后端API")
+# 安装了orjson时默认用它序列化响应（/session、/health、/status等轮询接口）
+app = FastAPI(
+    title="LiveTalking 后端API",
+    default_response_class=ORJSONResponse if orjson is not None else JSONResponse
+)
 
 # CORS配置
 app.add_middleware(
@@ -67,10 +113,65 @@ app.add_middleware(
 sessions: Dict[str, dict] = {}
 
 # 存储运行中的进程
-running_processes: Dict[str, subprocess.Popen] = {}
+running_processes: Dict[str, asyncio.subprocess.Process] = {}
 
 # 存储训练中的进程
-training_processes: Dict[str, subprocess.Popen] = {}
+training_processes: Dict[str, asyncio.subprocess.Process] = {}
+
+# 子进程PID -> Windows Job Object句柄
+process_jobs: Dict[int, object] = {}
+
+# 正在转写子进程输出的日志任务
+_pump_tasks: set = set()
+
+# 限制同时运行的ffmpeg数量（与_state_lock一样在startup中创建）
+_ffmpeg_semaphore: Optional[asyncio.Semaphore] = None
+
+# LiveTalking安装检查结果: (检查时间, 是否通过)
+_install_check = (float("-inf"), False)
+
+# /sessions 响应体缓存，sessions有任何写入时置空
+_sessions_json_cache: Optional[bytes] = None
+
+# 请求处理协程之间的会话状态锁
+# 在startup中创建：Python 3.8/3.9的asyncio原语会绑定导入时的事件循环，而uvicorn在新的循环中运行
+_state_lock: Optional[asyncio.Lock] = None
+
+# sessions写入和training_processes的线程锁（事件循环与线程池中的代码共享）
+_bg_lock = threading.Lock()
+
+# ==================== 会话持久化 ====================
+class SessionStore:
+    """sessions的sqlite存储（WAL模式），内存中的sessions字典仍是读写主体，修改时逐条写回"""
+    
+    def __init__(self, path: Path):
+        self.conn = sqlite3.connect(str(path), check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions (session_id TEXT PRIMARY KEY, data TEXT NOT NULL)"
+        )
+        # 连接在事件循环和线程池之间共享
+        self.lock = threading.Lock()
+    
+    def load(self) -> Dict[str, dict]:
+        with self.lock:
+            rows = self.conn.execute("SELECT session_id, data FROM sessions").fetchall()
+        return {session_id: json.loads(data) for session_id, data in rows}
+    
+    def save(self, session_id: str, session: dict):
+        data = json.dumps(session, ensure_ascii=False)
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO sessions (session_id, data) VALUES (?, ?)",
+                (session_id, data)
+            )
+    
+    def delete(self, session_id: str):
+        with self.lock:
+            self.conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+session_store = SessionStore(STATE_DB)
 
 # ==================== 数据模型 ====================
 class TrainRequest(BaseModel):
@@ -102,46 +203,199 @@ class SessionInfo(BaseModel):
 
 # ==================== 辅助函数 ====================
 def check_livetalking_installation():
-    """检查LiveTalking是否正确安装"""
-    if not os.path.exists(LIVETALKING_PATH):
-        logger.error(f"LiveTalking路径不存在: {LIVETALKING_PATH}")
-        return False
+    """检查LiveTalking是否正确安装（结果缓存INSTALL_CHECK_TTL秒，/health不必每次访问磁盘）"""
+    global _install_check
     
-    app_py = os.path.join(LIVETALKING_PATH, "app.py")
-    if not os.path.exists(app_py):
-        logger.error(f"app.py不存在: {app_py}")
+    checked_at, ok = _install_check
+    if time.monotonic() - checked_at < INSTALL_CHECK_TTL:
+        return ok
+    
+    ok = _check_livetalking_files()
+    _install_check = (time.monotonic(), ok)
+    return ok
+
+def _check_livetalking_files():
+    if not APP_PY.exists():
+        if not LIVETALKING_DIR.exists():
+            logger.error(f"LiveTalking路径不存在: {LIVETALKING_PATH}")
+        else:
+            logger.error(f"app.py不存在: {APP_PY}")
         return False
     
-    genavatar_py = os.path.join(WAV2LIP_PATH, "genavatar.py")
-    if not os.path.exists(genavatar_py):
-        logger.error(f"genavatar.py不存在: {genavatar_py}")
+    if not GENAVATAR_PY.exists():
+        logger.error(f"genavatar.py不存在: {GENAVATAR_PY}")
         return False
     
     logger.info("LiveTalking检查通过")
     return True
 
+def assign_job(pid: int):
+    """将子进程放入Job Object（Windows），之后可一次性终止整棵进程树"""
+    if win32job is None:
+        return
+    
+    try:
+        job = win32job.CreateJobObject(None, "")
+        info = win32job.QueryInformationJobObject(job, win32job.JobObjectExtendedLimitInformation)
+        info["BasicLimitInformation"]["LimitFlags"] |= win32job.JOB_OBJECT_LIMIT_KILL_ON_JOB_CLOSE
+        win32job.SetInformationJobObject(job, win32job.JobObjectExtendedLimitInformation, info)
+        handle = win32api.OpenProcess(win32con.PROCESS_SET_QUOTA | win32con.PROCESS_TERMINATE, False, pid)
+        win32job.AssignProcessToJobObject(job, handle)
+        process_jobs[pid] = job
+    except Exception as e:
+        logger.warning(f"创建Job Object失败 PID {pid}: {e}")
+
+async def pump_output(stream: asyncio.StreamReader, log_file: Path):
+    """把子进程输出按块追加到日志文件，每块直接os.write，无需Python缓冲和flush
+    
+    按固定大小读取而不是按行：tqdm进度条只输出回车不换行，按行读取会超过StreamReader的长度限制。
+    写文件在线程池中执行，不阻塞事件循环。
+    日志以追加方式打开，多次启动/重启后端不会覆盖之前的日志；子进程退出（管道关闭）时关闭fd
+    """
+    loop = asyncio.get_running_loop()
+    fd = await loop.run_in_executor(
+        None, os.open, log_file, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644
+    )
+    try:
+        while chunk := await stream.read(PUMP_CHUNK_SIZE):
+            await loop.run_in_executor(None, os.write, fd, chunk)
+    finally:
+        os.close(fd)
+
+def _pump_done(task: asyncio.Task):
+    """日志任务结束回调：移除引用，异常时记录日志"""
+    _pump_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(f"子进程日志转发失败: {task.exception()!r}")
+
+async def spawn_logged(cmd: List[str], cwd: str, log_file: Path) -> asyncio.subprocess.Process:
+    """异步启动子进程，输出通过管道实时写入log_file"""
+    process = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.STDOUT,
+        cwd=cwd,
+        env={**os.environ, "PYTHONUNBUFFERED": "1"},  # 子进程不缓冲输出
+        # 输出已经通过管道写入日志，新控制台只会是空窗口，Windows上不再创建
+        creationflags=getattr(subprocess, "CREATE_NO_WINDOW", 0)
+    )
+    assign_job(process.pid)
+    
+    # 保存任务引用，防止日志任务被垃圾回收
+    task = asyncio.create_task(pump_output(process.stdout, log_file))
+    _pump_tasks.add(task)
+    task.add_done_callback(_pump_done)
+    return process
+
+async def wait_for_start(process: asyncio.subprocess.Process):
+    """最多等待START_CHECK_TIMEOUT秒，进程退出或WebRTC端口可连接时提前返回
+    
+    端口可能已被其他LiveTalking实例占用，此时新进程会因绑定失败退出；
+    因此端口可连接后仍至少等到启动后START_MIN_WAIT秒，再由调用方检查进程是否存活
+    """
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    deadline = started + START_CHECK_TIMEOUT
+    while loop.time() < deadline:
+        if process.returncode is not None:
+            return
+        try:
+            _, writer = await asyncio.wait_for(
+                asyncio.open_connection("127.0.0.1", LIVETALKING_PORT), timeout=0.1
+            )
+        except (OSError, asyncio.TimeoutError):
+            await asyncio.sleep(0.1)
+            continue
+        writer.close()
+        break
+    
+    while loop.time() < started + START_MIN_WAIT and process.returncode is None:
+        await asyncio.sleep(0.1)
+
+def copy_file_fast(src: str, dst: str):
+    """由内核完成文件复制：Windows用CopyFileW，其它平台shutil.copyfile内部使用sendfile"""
+    if os.name == "nt":
+        if ctypes.windll.kernel32.CopyFileW(str(src), str(dst), False):
+            return
+        logger.warning(f"CopyFileW失败({ctypes.GetLastError()})，改用shutil复制: {src}")
+    shutil.copyfile(src, dst)
+
+def invalidate_sessions_cache():
+    """sessions被修改后调用，使 /sessions 下次请求时重新序列化"""
+    global _sessions_json_cache
+    _sessions_json_cache = None
+
+def session_changed(session_id: str):
+    """sessions[session_id]被修改或删除后调用：使 /sessions 缓存失效并同步到sqlite"""
+    invalidate_sessions_cache()
+    session = sessions.get(session_id)
+    if session is None:
+        session_store.delete(session_id)
+    else:
+        session_store.save(session_id, session)
+
+def restore_sessions():
+    """启动时从sqlite恢复会话，并清理上次运行遗留的状态"""
+    sessions.update(session_store.load())
+    
+    for session_id, session in sessions.items():
+        if session["status"] == "running":
+            # 上次运行的LiveTalking进程已无法管理，若仍存活则结束它
+            # PID可能已被系统分配给无关进程（如重启后），创建时间一致才认为是同一进程
+            pid = session.pop("pid", None)
+            create_time = session.pop("pid_create_time", None)
+            if pid is not None and create_time is not None and process_create_time(pid) == create_time:
+                kill_process_tree(pid)
+            session["status"] = "ready"
+            session_changed(session_id)
+        elif session["status"] == "training":
+            session["status"] = "error"
+            session["error"] = "后端重启，训练已中断"
+            session_changed(session_id)
+    
+    logger.info(f"已恢复 {len(sessions)} 个会话")
+
+def process_create_time(pid: int) -> Optional[float]:
+    """返回进程创建时间，进程不存在时返回None；与PID一起用于识别同一进程"""
+    try:
+        return psutil.Process(pid).create_time()
+    except psutil.Error:
+        return None
+
 def kill_process_tree(pid):
     """终止进程及其所有子进程（Windows）"""
+    job = process_jobs.pop(pid, None)
+    if job is not None:
+        try:
+            win32job.TerminateJobObject(job, 1)
+            logger.info(f"成功终止进程树 PID: {pid}")
+            return
+        except Exception as e:
+            logger.warning(f"Job Object终止失败，改为逐个终止 PID {pid}: {e}")
+    
     try:
         parent = psutil.Process(pid)
-        children = parent.children(recursive=True)
+        with parent.oneshot():
+            children = parent.children(recursive=True)
         
-        # 先终止子进程
-        for child in children:
-            try:
-                child.terminate()
-            except psutil.NoSuchProcess:
-                pass
-        
-        # 等待子进程结束
-        gone, alive = psutil.wait_procs(children, timeout=5)
-        
-        # 强制终止仍在运行的子进程
-        for p in alive:
-            try:
-                p.kill()
-            except psutil.NoSuchProcess:
-                pass
+        # 没有子进程（如ffmpeg）时跳过等待
+        if children:
+            # 先终止子进程
+            for child in children:
+                try:
+                    child.terminate()
+                except psutil.NoSuchProcess:
+                    pass
+            
+            # 等待子进程结束
+            gone, alive = psutil.wait_procs(children, timeout=5)
+            
+            # 强制终止仍在运行的子进程
+            for p in alive:
+                try:
+                    p.kill()
+                except psutil.NoSuchProcess:
+                    pass
         
         # 最后终止父进程
         try:
@@ -157,7 +411,25 @@ def kill_process_tree(pid):
     except Exception as e:
         logger.error(f"终止进程树失败 PID {pid}: {e}")
 
-def generate_video_from_image(image_path: str, output_path: str):
+def _copy_spooled(src, path: Path) -> str:
+    """从上传的SpooledTemporaryFile按块复制到目标文件，返回内容的SHA-256"""
+    digest = hashlib.sha256()
+    src.seek(0)
+    with open(path, "wb") as f:
+        while chunk := src.read(UPLOAD_CHUNK_SIZE):
+            digest.update(chunk)
+            f.write(chunk)
+    return digest.hexdigest()
+
+async def save_upload(file: UploadFile, path: Path) -> str:
+    """把上传文件写入磁盘，返回内容的SHA-256
+    
+    直接读取Starlette已落盘的临时文件，整个复制在线程池中一次完成，
+    不经过await file.read()逐块切换线程，内存中只保留一个块
+    """
+    return await asyncio.get_running_loop().run_in_executor(None, _copy_spooled, file.file, path)
+
+async def generate_video_from_image(image_path: str, output_path: str):
     """从图片生成视频（用于训练）"""
     try:
         # 使用ffmpeg将图片转换为视频
@@ -166,21 +438,36 @@ def generate_video_from_image(image_path: str, output_path: str):
             "ffmpeg",
             "-loop", "1",
             "-i", image_path,
+            "-vf", "scale=256:256",  # wav2lip需要256x256
             "-c:v", "libx264",
-            "-t", "3",
+            "-preset", "ultrafast",  # 静态画面无需高质量编码
+            "-tune", "stillimage",
             "-pix_fmt", "yuv420p",
-            "-vf", "scale=256:256",  # wav2lip需要256x256
+            "-t", "3",
             "-y",  # 覆盖输出文件
             output_path
         ]
         
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
+        # 异步等待ffmpeg，编码期间不阻塞事件循环；超过并发上限的请求排队
+        async with _ffmpeg_semaphore:
+            process = await asyncio.create_subprocess_exec(
+                *cmd,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE
+            )
+            try:
+                _, stderr = await asyncio.wait_for(process.communicate(), timeout=30)
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.wait()
+                logger.error(f"生成视频超时: {output_path}")
+                return False
         
-        if result.returncode == 0:
+        if process.returncode == 0:
             logger.info(f"成功从图片生成视频: {output_path}")
             return True
         else:
-            logger.error(f"生成视频失败: {result.stderr}")
+            logger.error(f"生成视频失败: {stderr.decode(errors='replace')}")
             return False
     except Exception as e:
         logger.error(f"生成视频异常: {e}")
@@ -209,6 +496,7 @@ async def train_model(request: TrainRequest, background_tasks: BackgroundTasks):
         "created_at": datetime.now().isoformat(),
         "progress": 0
     }
+    session_changed(request.session_id)
     
     # 在后台启动训练
     background_tasks.add_task(
@@ -226,19 +514,16 @@ async def train_model(request: TrainRequest, background_tasks: BackgroundTasks):
         "avatar_id": request.avatar_id
     }
 
-def run_training(session_id: str, avatar_id: str, video_path: str, audio_path: str, ref_text: str):
-    """执行训练过程"""
+async def run_training(session_id: str, avatar_id: str, video_path: str, audio_path: str, ref_text: str):
+    """执行训练过程（在事件循环中等待训练子进程，不占用线程池）"""
     try:
         logger.info(f"执行训练: session={session_id}, avatar={avatar_id}")
         
-        # 切换到wav2lip目录
-        os.chdir(WAV2LIP_PATH)
-        
         # 构建训练命令
         cmd = [
             "python",
             "genavatar.py",
-            "--video_path", video_path,
+            "--video_path", os.path.abspath(video_path),  # 子进程cwd为wav2lip目录，需传绝对路径
             "--img_size", "256",
             "--avatar_id", avatar_id
         ]
@@ -249,179 +534,182 @@ def run_training(session_id: str, avatar_id: str, video_path: str, audio_path: s
         log_file = LOGS_DIR / f"train_{session_id}.log"
         
         # 启动训练进程
-        with open(log_file, "w") as f:
-            process = subprocess.Popen(
-                cmd,
-                stdout=f,
-                stderr=subprocess.STDOUT,
-                text=True,
-                cwd=WAV2LIP_PATH,
-                creationflags=subprocess.CREATE_NEW_CONSOLE  # Windows: 新控制台
-            )
-            
-            # 保存进程引用
+        process = await spawn_logged(cmd, WAV2LIP_PATH, log_file)
+        
+        # 保存进程引用
+        with _bg_lock:
             training_processes[session_id] = process
+        
+        # 等待训练完成
+        return_code = await asyncio.wait_for(process.wait(), timeout=600)  # 10分钟超时
+        
+        if return_code == 0:
+            logger.info(f"训练成功: {session_id}")
             
-            # 等待训练完成
-            return_code = process.wait(timeout=600)  # 10分钟超时
+            # 将音频文件复制到LiveTalking的wav目录
+            wav_dir = os.path.join(LIVETALKING_PATH, "wav")
+            os.makedirs(wav_dir, exist_ok=True)
             
-            if return_code == 0:
-                logger.info(f"训练成功: {session_id}")
-                sessions[session_id]["status"] = "ready"
-                
-                # 将音频文件复制到LiveTalking的wav目录
-                wav_dir = os.path.join(LIVETALKING_PATH, "wav")
-                os.makedirs(wav_dir, exist_ok=True)
-                
-                audio_filename = f"{avatar_id}.wav"
-                dest_audio = os.path.join(wav_dir, audio_filename)
-                shutil.copy2(audio_path, dest_audio)
-                
+            audio_filename = f"{avatar_id}.wav"
+            dest_audio = os.path.join(wav_dir, audio_filename)
+            await asyncio.get_running_loop().run_in_executor(None, copy_file_fast, audio_path, dest_audio)
+            
+            with _bg_lock:
                 sessions[session_id]["ref_file"] = f"wav/{audio_filename}"
-                logger.info(f"音频文件已复制到: {dest_audio}")
-                
-            else:
-                logger.error(f"训练失败，返回码: {return_code}")
+                sessions[session_id]["status"] = "ready"
+                session_changed(session_id)
+            logger.info(f"音频文件已复制到: {dest_audio}")
+            
+        else:
+            logger.error(f"训练失败，返回码: {return_code}")
+            with _bg_lock:
                 sessions[session_id]["status"] = "error"
                 sessions[session_id]["error"] = f"训练失败，返回码: {return_code}"
+                session_changed(session_id)
     
-    except subprocess.TimeoutExpired:
+    except asyncio.TimeoutError:
         logger.error(f"训练超时: {session_id}")
-        sessions[session_id]["status"] = "error"
-        sessions[session_id]["error"] = "训练超时"
-        if session_id in training_processes:
-            kill_process_tree(training_processes[session_id].pid)
-            del training_processes[session_id]
+        with _bg_lock:
+            sessions[session_id]["status"] = "error"
+            sessions[session_id]["error"] = "训练超时"
+            session_changed(session_id)
+            process = training_processes.pop(session_id, None)
+        if process is not None:
+            await asyncio.get_running_loop().run_in_executor(None, kill_process_tree, process.pid)
     
     except Exception as e:
         logger.error(f"训练异常: {e}", exc_info=True)
-        sessions[session_id]["status"] = "error"
-        sessions[session_id]["error"] = str(e)
+        with _bg_lock:
+            if session_id in sessions:
+                sessions[session_id]["status"] = "error"
+                sessions[session_id]["error"] = str(e)
+                session_changed(session_id)
     
     finally:
         # 清理进程引用
-        if session_id in training_processes:
-            del training_processes[session_id]
-        
-        # 切回原目录
-        os.chdir(Path(__file__).parent)
+        with _bg_lock:
+            process = training_processes.pop(session_id, None)
+        if process is not None:
+            process_jobs.pop(process.pid, None)
 
 @app.post("/start")
 async def start_avatar(request: StartRequest):
-    """启动数字人"""
+    """启动数字人
     
-    if request.session_id not in sessions:
-        raise HTTPException(status_code=404, detail="会话不存在")
+    _state_lock只在检查/修改字典和创建子进程时持有，等待就绪在锁外进行，不阻塞其它会话的请求
+    """
     
-    session = sessions[request.session_id]
+    async with _state_lock:
+        if request.session_id not in sessions:
+            raise HTTPException(status_code=404, detail="会话不存在")
     
-    if session["status"] != "ready":
-        raise HTTPException(status_code=400, detail=f"会话未就绪: {session['status']}")
+        session = sessions[request.session_id]
     
-    if request.session_id in running_processes:
-        raise HTTPException(status_code=400, detail="该数字人已在运行")
+        if session["status"] != "ready":
+            raise HTTPException(status_code=400, detail=f"会话未就绪: {session['status']}")
     
-    try:
-        # 切换到LiveTalking主目录
-        os.chdir(LIVETALKING_PATH)
-        
-        # 构建运行命令
-        cmd = [
-            "python",
-            "app.py",
-            "--transport", "webrtc",
-            "--model", "wav2lip",
-            "--avatar_id", session["avatar_id"],
-            "--tts", "cosyvoice",
-            "--TTS_SERVER", TTS_SERVER,
-            "--REF_FILE", session["ref_file"],
-            "--REF_TEXT", session["ref_text"]
-        ]
-        
-        logger.info(f"启动命令: {' '.join(cmd)}")
-        
-        # 创建日志文件
-        log_file = LOGS_DIR / f"run_{request.session_id}.log"
+        if request.session_id in running_processes:
+            raise HTTPException(status_code=400, detail="该数字人已在运行")
+    
+        try:
+            # 构建运行命令
+            cmd = [
+                "python",
+                "app.py",
+                "--transport", "webrtc",
+                "--model", "wav2lip",
+                "--avatar_id", session["avatar_id"],
+                "--tts", "cosyvoice",
+                "--TTS_SERVER", TTS_SERVER,
+                "--REF_FILE", session["ref_file"],
+                "--REF_TEXT", session["ref_text"]
+            ]
         
-        # 启动进程
-        with open(log_file, "w") as f:
-            process = subprocess.Popen(
-                cmd,
-                stdout=f,
-                stderr=subprocess.STDOUT,
-                text=True,
-                cwd=LIVETALKING_PATH,
-                creationflags=subprocess.CREATE_NEW_CONSOLE  # Windows: 新控制台
-            )
+            logger.info(f"启动命令: {' '.join(cmd)}")
         
-        # 保存进程引用
-        running_processes[request.session_id] = process
+            # 创建日志文件
+            log_file = LOGS_DIR / f"run_{request.session_id}.log"
         
-        # 更新会话状态
-        session["status"] = "running"
-        session["pid"] = process.pid
+            # 启动进程
+            process = await spawn_logged(cmd, LIVETALKING_PATH, log_file)
         
-        # 等待一下确保进程启动
-        time.sleep(2)
+            # 保存进程引用
+            running_processes[request.session_id] = process
         
-        # 检查进程是否仍在运行
-        if process.poll() is not None:
-            del running_processes[request.session_id]
+            # 更新会话状态（状态变为running后，并发的/start会被拒绝）
+            session["status"] = "running"
+            session["pid"] = process.pid
+            session["pid_create_time"] = process_create_time(process.pid)
+            session_changed(request.session_id)
+    
+        except Exception as e:
+            logger.error(f"启动失败: {e}", exc_info=True)
             session["status"] = "error"
-            raise HTTPException(status_code=500, detail="启动失败，进程已退出")
-        
-        logger.info(f"成功启动数字人: {request.session_id}, PID: {process.pid}")
-        
-        return {
-            "status": "started",
-            "session_id": request.session_id,
-            "pid": process.pid,
-            "webrtc_url": "http://localhost:8010"  # LiveTalking的WebRTC地址
-        }
+            session_changed(request.session_id)
+            raise HTTPException(status_code=500, detail=f"启动失败: {e}")
     
-    except Exception as e:
-        logger.error(f"启动失败: {e}", exc_info=True)
-        session["status"] = "error"
-        raise HTTPException(status_code=500, detail=f"启动失败: {e}")
+    # 等待进程就绪：端口可连接即提前返回，不阻塞事件循环
+    await wait_for_start(process)
     
-    finally:
-        # 切回原目录
-        os.chdir(Path(__file__).parent)
+    # 检查进程是否仍在运行
+    if process.returncode is not None:
+        async with _state_lock:
+            # 等待期间可能已被/stop处理，此时不再改动会话状态
+            if running_processes.get(request.session_id) is process:
+                del running_processes[request.session_id]
+                session["status"] = "error"
+                session_changed(request.session_id)
+            process_jobs.pop(process.pid, None)
+        logger.error(f"启动失败，进程已退出: {request.session_id}, 返回码: {process.returncode}")
+        raise HTTPException(status_code=500, detail="启动失败，进程已退出")
+    
+    logger.info(f"成功启动数字人: {request.session_id}, PID: {process.pid}")
+    
+    return {
+        "status": "started",
+        "session_id": request.session_id,
+        "pid": process.pid,
+        "webrtc_url": f"http://localhost:{LIVETALKING_PORT}"  # LiveTalking的WebRTC地址
+    }
 
 @app.post("/stop")
 async def stop_avatar(request: StopRequest):
-    """停止数字人"""
+    """停止数字人
     
-    if request.session_id not in running_processes:
+    在锁内取出进程引用，终止进程树（可能需要数秒）在锁外进行
+    """
+    
+    async with _state_lock:
+        process = running_processes.pop(request.session_id, None)
+    if process is None:
         return {"status": "not_running", "message": "该数字人未在运行"}
     
+    pid = process.pid
     try:
-        process = running_processes[request.session_id]
-        pid = process.pid
-        
-        # 终止进程树
-        kill_process_tree(pid)
-        
-        # 清理进程引用
-        del running_processes[request.session_id]
-        
+        # 终止进程树（可能等待数秒，放到线程池执行）
+        await asyncio.get_running_loop().run_in_executor(None, kill_process_tree, pid)
+    except Exception as e:
+        logger.error(f"停止失败: {e}", exc_info=True)
+        # 放回进程引用，允许重试停止
+        async with _state_lock:
+            running_processes.setdefault(request.session_id, process)
+        raise HTTPException(status_code=500, detail=f"停止失败: {e}")
+    
+    async with _state_lock:
         # 更新会话状态
         if request.session_id in sessions:
             sessions[request.session_id]["status"] = "ready"
-            if "pid" in sessions[request.session_id]:
-                del sessions[request.session_id]["pid"]
-        
-        logger.info(f"成功停止数字人: {request.session_id}")
-        
-        return {
-            "status": "stopped",
-            "session_id": request.session_id,
-            "pid": pid
-        }
+            sessions[request.session_id].pop("pid", None)
+            sessions[request.session_id].pop("pid_create_time", None)
+            session_changed(request.session_id)
     
-    except Exception as e:
-        logger.error(f"停止失败: {e}", exc_info=True)
-        raise HTTPException(status_code=500, detail=f"停止失败: {e}")
+    logger.info(f"成功停止数字人: {request.session_id}")
+    
+    return {
+        "status": "stopped",
+        "session_id": request.session_id,
+        "pid": pid
+    }
 
 @app.post("/chat")
 async def chat_with_avatar(request: ChatRequest):
@@ -435,9 +723,10 @@ async def chat_with_avatar(request: ChatRequest):
     
     # 检查进程是否仍在运行
     process = running_processes[request.session_id]
-    if process.poll() is not None:
+    if process.returncode is not None:
         del running_processes[request.session_id]
         sessions[request.session_id]["status"] = "error"
+        session_changed(request.session_id)
         raise HTTPException(status_code=400, detail="数字人进程已退出")
     
     # 注意：实际的对话通过WebRTC在前端直接与LiveTalking通信
@@ -445,39 +734,84 @@ async def chat_with_avatar(request: ChatRequest):
     return {
         "status": "success",
         "message": "消息已接收，请通过WebRTC查看数字人回应",
-        "webrtc_url": "http://localhost:8010"
+        "webrtc_url": f"http://localhost:{LIVETALKING_PORT}"
     }
 
 @app.get("/sessions")
 async def list_sessions():
-    """列出所有会话"""
-    return {
-        "sessions": list(sessions.values()),
-        "total": len(sessions)
-    }
+    """列出所有会话（序列化结果缓存到下次修改）"""
+    global _sessions_json_cache
+    
+    # 持有_bg_lock构建，避免序列化期间发生写入后缓存仍是旧数据
+    with _bg_lock:
+        if _sessions_json_cache is None:
+            payload = {
+                "sessions": list(sessions.values()),
+                "total": len(sessions)
+            }
+            if orjson is not None:
+                _sessions_json_cache = orjson.dumps(payload)
+            else:
+                _sessions_json_cache = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        body = _sessions_json_cache
+    
+    return Response(content=body, media_type="application/json")
+
+@app.get("/events")
+async def session_events():
+    """以SSE推送会话状态变化，前端用一个连接代替逐会话轮询"""
+    
+    async def event_stream():
+        last_states = {}
+        idle_ticks = 0
+        while True:
+            for session_id, session in list(sessions.items()):
+                state = (session.get("status"), session.get("pid"), session.get("error"))
+                if last_states.get(session_id) != state:
+                    last_states[session_id] = state
+                    event = {
+                        "session_id": session_id,
+                        "status": state[0],
+                        "pid": state[1],
+                        "error": state[2]
+                    }
+                    idle_ticks = 0
+                    yield f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+            
+            # 定期发送注释行，及时发现已断开的连接
+            idle_ticks += 1
+            if idle_ticks >= 15:
+                idle_ticks = 0
+                yield ": keepalive\n\n"
+            
+            await asyncio.sleep(1)
+    
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
 
 @app.get("/session/{session_id}")
 async def get_session(session_id: str):
     """获取会话详情"""
     
-    if session_id not in sessions:
-        raise HTTPException(status_code=404, detail="会话不存在")
+    async with _state_lock:
+        if session_id not in sessions:
+            raise HTTPException(status_code=404, detail="会话不存在")
     
-    session = sessions[session_id].copy()
+        session = sessions[session_id].copy()
     
-    # 检查进程状态
-    if session_id in running_processes:
-        process = running_processes[session_id]
-        if process.poll() is None:
-            session["is_running"] = True
-            session["pid"] = process.pid
+        # 检查进程状态
+        if session_id in running_processes:
+            process = running_processes[session_id]
+            if process.returncode is None:
+                session["is_running"] = True
+                session["pid"] = process.pid
+            else:
+                session["is_running"] = False
+                del running_processes[session_id]
+                process_jobs.pop(process.pid, None)
         else:
             session["is_running"] = False
-            del running_processes[session_id]
-    else:
-        session["is_running"] = False
     
-    return session
+        return session
 
 @app.delete("/session/{session_id}")
 async def delete_session(session_id: str):
@@ -486,17 +820,22 @@ async def delete_session(session_id: str):
     if session_id not in sessions:
         raise HTTPException(status_code=404, detail="会话不存在")
     
-    # 如果正在运行，先停止
+    # 如果正在运行，先停止（stop_avatar自己持有_state_lock，asyncio.Lock不可重入）
     if session_id in running_processes:
         await stop_avatar(StopRequest(session_id=session_id))
     
-    # 如果正在训练，终止训练
-    if session_id in training_processes:
-        kill_process_tree(training_processes[session_id].pid)
-        del training_processes[session_id]
+    # 如果正在训练，终止训练（在锁外等待终止完成）
+    async with _state_lock:
+        with _bg_lock:
+            process = training_processes.pop(session_id, None)
+    if process is not None:
+        await asyncio.get_running_loop().run_in_executor(None, kill_process_tree, process.pid)
     
-    # 删除会话信息
-    del sessions[session_id]
+    async with _state_lock:
+        # 删除会话信息
+        with _bg_lock:
+            sessions.pop(session_id, None)
+            session_changed(session_id)
     
     logger.info(f"删除会话: {session_id}")
     
@@ -512,16 +851,21 @@ async def upload_image(file: UploadFile = File(...)):
     
     # 保存图片
     image_path = UPLOAD_DIR / filename
-    with open(image_path, "wb") as f:
-        content = await file.read()
-        f.write(content)
+    image_hash = await save_upload(file, image_path)
     
-    # 生成视频
-    video_filename = f"{timestamp}_generated.mp4"
-    video_path = UPLOAD_DIR / video_filename
+    # 生成视频（按图片内容缓存，相同图片直接复用已生成的视频）
+    video_path = UPLOAD_DIR / f"{image_hash}_generated.mp4"
     
-    if not generate_video_from_image(str(image_path), str(video_path)):
-        raise HTTPException(status_code=500, detail="生成视频失败")
+    if video_path.exists():
+        logger.info(f"复用已生成的视频: {video_path}")
+    else:
+        # 先写到临时文件再改名，避免并发请求读到未写完的视频
+        tmp_path = UPLOAD_DIR / f"{image_hash}_{uuid.uuid4().hex}.mp4"
+        if not await generate_video_from_image(str(image_path), str(tmp_path)):
+            if tmp_path.exists():
+                tmp_path.unlink()
+            raise HTTPException(status_code=500, detail="生成视频失败")
+        os.replace(tmp_path, video_path)
     
     return {
         "image_path": str(image_path),
@@ -539,19 +883,15 @@ async def upload_audio(file: UploadFile = File(...)):
     
     # 保存音频
     audio_path = UPLOAD_DIR / filename
-    with open(audio_path, "wb") as f:
-        content = await file.read()
-        f.write(content)
+    await save_upload(file, audio_path)
     
     return {
         "audio_path": str(audio_path),
         "filename": filename
     }
 
-@app.get("/health")
-async def health_check():
-    """健康检查"""
-    
+def get_health() -> dict:
+    """汇总后端健康信息"""
     livetalking_ok = check_livetalking_installation()
     
     return {
@@ -562,26 +902,89 @@ async def health_check():
         "training": len(training_processes)
     }
 
+@app.post("/create_session")
+async def create_session(
+    background_tasks: BackgroundTasks,
+    session_id: str = Form(...),
+    avatar_id: str = Form(...),
+    ref_text: str = Form(...),
+    prompt: str = Form(""),
+    image: UploadFile = File(...),
+    audio: UploadFile = File(...)
+):
+    """一次请求完成图片上传、音频上传和训练提交"""
+    
+    # 先检查会话状态，避免无效上传
+    if session_id in sessions and sessions[session_id]["status"] == "training":
+        raise HTTPException(status_code=400, detail="该会话正在训练中")
+    
+    image_data = await upload_image(image)
+    audio_data = await upload_audio(audio)
+    
+    result = await train_model(
+        TrainRequest(
+            session_id=session_id,
+            avatar_id=avatar_id,
+            video_path=image_data["video_path"],
+            audio_path=audio_data["audio_path"],
+            ref_text=ref_text,
+            prompt=prompt
+        ),
+        background_tasks
+    )
+    
+    return {
+        **result,
+        "image_path": image_data["image_path"],
+        "video_path": image_data["video_path"],
+        "audio_path": audio_data["audio_path"]
+    }
+
+@app.get("/health")
+async def health_check():
+    """健康检查"""
+    return get_health()
+
+@app.get("/status")
+async def get_status():
+    """一次返回健康信息和会话列表，供前端定时刷新使用"""
+    return {
+        "health": get_health(),
+        "sessions": list(sessions.values()),
+        "total": len(sessions)
+    }
+
+@app.on_event("startup")
+async def startup_event():
+    """创建会话状态锁和ffmpeg信号量，恢复持久化的会话，并限制线程池大小，突发请求排队而不是抢占CPU和磁盘"""
+    global _state_lock, _ffmpeg_semaphore
+    _state_lock = asyncio.Lock()
+    _ffmpeg_semaphore = asyncio.Semaphore(BG_WORKERS)
+    
+    restore_sessions()
+    
+    from anyio.to_thread import current_default_thread_limiter
+    current_default_thread_limiter().total_tokens = THREAD_LIMIT
+    
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=BG_WORKERS, thread_name_prefix="bg")
+    )
+
 @app.on_event("shutdown")
 async def shutdown_event():
     """关闭时清理所有进程"""
     logger.info("正在关闭所有运行中的进程...")
     
-    # 停止所有运行中的数字人
-    for session_id, process in list(running_processes.items()):
-        try:
-            kill_process_tree(process.pid)
-        except:
-            pass
-    
-    # 停止所有训练进程
-    for session_id, process in list(training_processes.items()):
-        try:
-            kill_process_tree(process.pid)
-        except:
-            pass
+    # 并行停止所有运行中的数字人和训练进程
+    loop = asyncio.get_running_loop()
+    processes = list(running_processes.values()) + list(training_processes.values())
+    await asyncio.gather(
+        *[loop.run_in_executor(None, kill_process_tree, process.pid) for process in processes],
+        return_exceptions=True
+    )
     
     logger.info("所有进程已清理")
+    _log_listener.stop()
 
 if __name__ == "__main__":
     # 检查LiveTalking安装
@@ -3,9 +3,11 @@ LiveTalking 后端API服务 - 改进版
 支持视频上传、自动扫描已有数字人、自动移动训练结果
 """
 
-from fastapi import FastAPI, HTTPException, BackgroundTasks, File, UploadFile
-from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi import FastAPI, HTTPException, BackgroundTasks, File, UploadFile, Request
+from fastapi.responses import StreamingResponse, JSONResponse, ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import UploadFile as FormFile
 from pydantic import BaseModel
 import uvicorn
 import subprocess
@@ -19,9 +21,32 @@ from typing import Dict, Optional, List
 from pathlib import Path
 import signal
 import shutil
+import itertools
 from datetime import datetime
 import psutil
 
+try:
+    import win32api  # 可选（Windows）: pip install pywin32
+    import win32con
+    import win32job
+except ImportError:
+    win32job = None
+
+try:
+    import uvloop  # 可选（Linux/macOS）: pip install uvloop
+except ImportError:
+    uvloop = None
+
+try:
+    import httptools  # 可选: pip install httptools
+except ImportError:
+    httptools = None
+
+try:
+    import orjson  # 可选: pip install orjson
+except ImportError:
+    orjson = None
+
 # ==================== 配置部分 ====================
 # LiveTalking项目路径
 LIVETALKING_PATH = r"D:\Projects\See You Again\src\LiveTalking\LiveTalking-main"
@@ -35,10 +60,28 @@ WAV_DIR = os.path.join(LIVETALKING_PATH, "wav")  # 音频文件目录
 # TTS服务器配置
 TTS_SERVER = "http://127.0.0.1:50000"
 
+# LiveTalking WebRTC端口，启动后探测该端口判断是否就绪
+LIVETALKING_PORT = 8010
+START_CHECK_TIMEOUT = 2.0  # 启动检查最长等待时间（秒）
+START_MIN_WAIT = 1.0  # 端口可连接后至少等待的时间（秒），确认进程没有因端口占用退出
+
+# 子进程输出已写入logs，默认不再为每个子进程分配控制台窗口；调试时设置 LIVETALKING_SHOW_CONSOLE=1
+SHOW_CONSOLE = os.environ.get("LIVETALKING_SHOW_CONSOLE") == "1"
+# 这两个常量只在Windows上存在，其它平台取0，保证模块可以导入
+CREATION_FLAGS = (
+    getattr(subprocess, "CREATE_NEW_CONSOLE", 0) if SHOW_CONSOLE
+    else getattr(subprocess, "CREATE_NO_WINDOW", 0)
+)
+
 # 文件存储路径
 UPLOAD_DIR = Path("uploads")
 LOGS_DIR = Path("logs")
 
+UPLOAD_CHUNK_SIZE = 1 << 20  # 上传文件分块写入大小（1MB）
+MAX_UPLOAD_SIZE = 2 << 30  # 单个上传请求上限（2GB）
+TRAINING_CONCURRENCY = 2  # 同时运行的训练进程上限，其余请求排队
+REAP_INTERVAL = 0.5  # 后台检查子进程状态的间隔（秒）
+
 # 创建必要的目录
 for dir_path in [UPLOAD_DIR, LOGS_DIR]:
     dir_path.mkdir(exist_ok=True, parents=True)
@@ -60,7 +103,11 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # ==================== FastAPI初始化 ====================
-app = FastAPI(title="LiveTalking 后端API - 改进版")
+# 安装了orjson时默认用它序列化响应（/avatars、/health、/training-status）
+app = FastAPI(
+    title="LiveTalking 后端API - 改进版",
+    default_response_class=ORJSONResponse if orjson is not None else JSONResponse
+)
 
 # CORS配置
 app.add_middleware(
@@ -71,6 +118,15 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def limit_upload_size(request: Request, call_next):
+    """声明的大小超过上限的上传请求直接拒绝，不写入磁盘"""
+    if request.url.path.startswith("/upload/"):
+        length = request.headers.get("content-length", "")
+        if length.isdigit() and int(length) > MAX_UPLOAD_SIZE:
+            return JSONResponse(status_code=413, content={"detail": "上传文件过大"})
+    return await call_next(request)
+
 # ==================== 全局变量 ====================
 # 存储会话信息
 sessions: Dict[str, dict] = {}
@@ -81,6 +137,32 @@ running_processes: Dict[str, subprocess.Popen] = {}
 # 存储训练中的进程
 training_processes: Dict[str, subprocess.Popen] = {}
 
+# 数字人目录扫描缓存: (AVATARS_DIR的mtime, 数字人列表)
+_avatar_cache = (None, [])
+
+# 子进程PID -> Windows Job Object句柄
+process_jobs: Dict[int, object] = {}
+
+# 后台检查得到的进程状态，/avatars 直接读取，不再逐个poll()
+_running_pids: Dict[str, int] = {}
+_training_ids: frozenset = frozenset()
+_status_generation = 0  # 进程状态每变化一次加1
+
+# /avatars 响应缓存: ((数字人目录mtime, 状态版本), 响应)
+_avatars_response = (None, None)
+
+# 文件名序号
+_file_seq = itertools.count()
+
+# 后台状态检查任务
+_reaper_task: Optional[asyncio.Task] = None
+
+# 已知存在的数字人，每次重新扫描目录时整体重建
+_avatar_set: frozenset = frozenset()
+
+# 训练槽位（run_training在BackgroundTasks线程池中执行）
+_training_slots = threading.BoundedSemaphore(TRAINING_CONCURRENCY)
+
 # ==================== 数据模型 ====================
 class TrainRequest(BaseModel):
     avatar_id: str  # 用户自定义的avatar ID
@@ -100,26 +182,49 @@ class ChatRequest(BaseModel):
     message: str
 
 # ==================== 辅助函数 ====================
+def file_stamp() -> str:
+    """生成文件名前缀：秒级时间戳 + 递增序号，同一秒内的多个请求也不会重名"""
+    return f"{time.strftime('%Y%m%d_%H%M%S')}_{next(_file_seq)}"
+
 def scan_existing_avatars() -> List[str]:
-    """扫描已有的数字人"""
-    avatars = []
+    """扫描已有的数字人（AVATARS_DIR的mtime未变化时直接返回上次结果）"""
+    global _avatar_cache, _avatar_set
+    
+    try:
+        mtime = os.stat(AVATARS_DIR).st_mtime_ns
+    except FileNotFoundError:
+        _avatar_cache = (None, [])
+        _avatar_set = frozenset()
+        return []
+    
+    if _avatar_cache[0] == mtime:
+        return list(_avatar_cache[1])
     
-    if os.path.exists(AVATARS_DIR):
-        for item in os.listdir(AVATARS_DIR):
-            item_path = os.path.join(AVATARS_DIR, item)
-            if os.path.isdir(item_path) and item.startswith("wav2lip256_"):
-                avatars.append(item)
-                logger.info(f"发现数字人: {item}")
+    # scandir的DirEntry自带类型信息，is_dir()通常不需要额外stat
+    with os.scandir(AVATARS_DIR) as entries:
+        avatars = [e.name for e in entries if e.name.startswith("wav2lip256_") and e.is_dir()]
     
-    return avatars
+    for item in avatars:
+        logger.info(f"发现数字人: {item}")
+    
+    _avatar_cache = (mtime, avatars)
+    _avatar_set = frozenset(avatars)
+    return list(avatars)
 
 def check_avatar_exists(avatar_id: str) -> bool:
-    """检查数字人是否存在"""
-    avatar_path = os.path.join(AVATARS_DIR, avatar_id)
-    return os.path.exists(avatar_path)
+    """检查数字人是否存在（目录mtime未变化时只需一次stat，随后查内存中的集合）"""
+    scan_existing_avatars()
+    return avatar_id in _avatar_set
+
+def move_dir(source: str, dest: str):
+    """移动目录：同一磁盘上直接重命名，跨磁盘时才退回shutil.move逐字节复制"""
+    try:
+        os.replace(source, dest)
+    except OSError:
+        shutil.move(source, dest)
 
 def move_trained_avatar(avatar_id: str) -> bool:
-    """将训练好的数字人从results移动到data/avatars"""
+    """将训练好的数字人从results移动到data/avatars（目录mtime随之变化，下次扫描时自动更新集合）"""
     source_path = os.path.join(RESULTS_DIR, avatar_id)
     dest_path = os.path.join(AVATARS_DIR, avatar_id)
     
@@ -128,11 +233,11 @@ def move_trained_avatar(avatar_id: str) -> bool:
             # 如果目标已存在，先备份
             if os.path.exists(dest_path):
                 backup_path = f"{dest_path}_backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-                shutil.move(dest_path, backup_path)
+                move_dir(dest_path, backup_path)
                 logger.info(f"已备份原数字人到: {backup_path}")
             
             # 移动文件夹
-            shutil.move(source_path, dest_path)
+            move_dir(source_path, dest_path)
             logger.info(f"成功移动数字人: {avatar_id}")
             logger.info(f"从: {source_path}")
             logger.info(f"到: {dest_path}")
@@ -144,8 +249,123 @@ def move_trained_avatar(avatar_id: str) -> bool:
         logger.error(f"移动数字人失败: {e}")
         return False
 
+def _copy_upload(src, path: Path):
+    src.seek(0)
+    with open(path, "wb") as f:
+        shutil.copyfileobj(src, f, UPLOAD_CHUNK_SIZE)
+
+async def save_upload(file: UploadFile, path: Path):
+    """分块把上传文件写入磁盘，不把整个文件读入内存，也不阻塞事件循环
+    
+    直接从Starlette的临时文件按块复制，整个复制在线程池中一次完成
+    """
+    await run_in_threadpool(_copy_upload, file.file, path)
+
+async def save_stream(request: Request, path: Path):
+    """把原始请求体边接收边写入目标文件，不经过临时文件，超过上限时中止
+    
+    接收到的数据攒满UPLOAD_CHUNK_SIZE后在线程池中写盘，打开/写入/关闭都不阻塞事件循环
+    """
+    size = 0
+    buffer = bytearray()
+    f = await run_in_threadpool(open, path, "wb")
+    try:
+        async for chunk in request.stream():
+            size += len(chunk)
+            if size > MAX_UPLOAD_SIZE:
+                raise HTTPException(status_code=413, detail="上传文件过大")
+            buffer += chunk
+            if len(buffer) >= UPLOAD_CHUNK_SIZE:
+                await run_in_threadpool(f.write, bytes(buffer))
+                buffer.clear()
+        if buffer:
+            await run_in_threadpool(f.write, bytes(buffer))
+        await run_in_threadpool(f.close)
+    except BaseException:
+        f.close()
+        path.unlink(missing_ok=True)
+        raise
+
+def refresh_process_status(force: bool = False):
+    """重新检查运行/训练进程是否存活；状态变化或force时递增代数，使/avatars缓存失效
+    
+    /start、/stop、/train修改进程状态后立即调用，不必等下一次定期检查
+    """
+    global _running_pids, _training_ids, _status_generation
+    
+    running_pids = {
+        avatar_id: process.pid
+        for avatar_id, process in list(running_processes.items())
+        if process.poll() is None
+    }
+    training_ids = frozenset(
+        avatar_id
+        for avatar_id, process in list(training_processes.items())
+        if process.poll() is None
+    )
+    if force or running_pids != _running_pids or training_ids != _training_ids:
+        _running_pids = running_pids
+        _training_ids = training_ids
+        _status_generation += 1
+
+async def reap_processes():
+    """定期检查运行/训练进程是否仍存活，结果保存在内存中"""
+    while True:
+        refresh_process_status()
+        await asyncio.sleep(REAP_INTERVAL)
+
+def assign_job(pid: int):
+    """将子进程放入Job Object（Windows），之后可一次性终止整棵进程树"""
+    if win32job is None:
+        return
+    
+    try:
+        job = win32job.CreateJobObject(None, "")
+        info = win32job.QueryInformationJobObject(job, win32job.JobObjectExtendedLimitInformation)
+        info["BasicLimitInformation"]["LimitFlags"] |= win32job.JOB_OBJECT_LIMIT_KILL_ON_JOB_CLOSE
+        win32job.SetInformationJobObject(job, win32job.JobObjectExtendedLimitInformation, info)
+        handle = win32api.OpenProcess(win32con.PROCESS_SET_QUOTA | win32con.PROCESS_TERMINATE, False, pid)
+        win32job.AssignProcessToJobObject(job, handle)
+        process_jobs[pid] = job
+    except Exception as e:
+        logger.warning(f"创建Job Object失败 PID {pid}: {e}")
+
+async def wait_for_start(process: subprocess.Popen):
+    """最多等待START_CHECK_TIMEOUT秒，进程退出或WebRTC端口可连接时提前返回
+    
+    端口可能已被其他LiveTalking实例占用，此时新进程会因绑定失败退出；
+    因此端口可连接后仍至少等到启动后START_MIN_WAIT秒，再由调用方检查进程是否存活
+    """
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    deadline = started + START_CHECK_TIMEOUT
+    while loop.time() < deadline:
+        if process.poll() is not None:
+            return
+        try:
+            _, writer = await asyncio.wait_for(
+                asyncio.open_connection("127.0.0.1", LIVETALKING_PORT), timeout=0.1
+            )
+        except (OSError, asyncio.TimeoutError):
+            await asyncio.sleep(0.1)
+            continue
+        writer.close()
+        break
+    
+    while loop.time() < started + START_MIN_WAIT and process.poll() is None:
+        await asyncio.sleep(0.1)
+
 def kill_process_tree(pid):
     """终止进程及其所有子进程（Windows）"""
+    job = process_jobs.pop(pid, None)
+    if job is not None:
+        try:
+            win32job.TerminateJobObject(job, 1)
+            logger.info(f"成功终止进程树 PID: {pid}")
+            return
+        except Exception as e:
+            logger.warning(f"Job Object终止失败，改为逐个终止 PID {pid}: {e}")
+    
     try:
         parent = psutil.Process(pid)
         children = parent.children(recursive=True)
@@ -180,8 +400,13 @@ def kill_process_tree(pid):
 # ==================== API端点 ====================
 @app.get("/avatars")
 async def list_avatars():
-    """获取所有可用的数字人"""
+    """获取所有可用的数字人（数字人目录和进程状态都未变化时直接返回上次的结果）"""
+    global _avatars_response
+    
     avatars = scan_existing_avatars()
+    key = (_avatar_cache[0], _status_generation)
+    if _avatars_response[0] == key:
+        return _avatars_response[1]
     
     # 获取每个数字人的状态
     avatar_info = []
@@ -194,25 +419,24 @@ async def list_avatars():
         }
         
         # 检查是否正在运行
-        if avatar_id in running_processes:
-            process = running_processes[avatar_id]
-            if process.poll() is None:
-                info["status"] = "running"
-                info["is_running"] = True
-                info["pid"] = process.pid
+        pid = _running_pids.get(avatar_id)
+        if pid is not None:
+            info["status"] = "running"
+            info["is_running"] = True
+            info["pid"] = pid
         
         # 检查是否正在训练
-        if avatar_id in training_processes:
-            process = training_processes[avatar_id]
-            if process.poll() is None:
-                info["status"] = "training"
+        if avatar_id in _training_ids:
+            info["status"] = "training"
         
         avatar_info.append(info)
     
-    return {
+    response = {
         "avatars": avatar_info,
         "total": len(avatar_info)
     }
+    _avatars_response = (key, response)
+    return response
 
 @app.post("/train")
 async def train_model(request: TrainRequest, background_tasks: BackgroundTasks):
@@ -251,6 +475,7 @@ async def train_model(request: TrainRequest, background_tasks: BackgroundTasks):
         request.audio_path,
         request.ref_text
     )
+    refresh_process_status(force=True)
     
     return {
         "status": "training_started",
@@ -259,20 +484,22 @@ async def train_model(request: TrainRequest, background_tasks: BackgroundTasks):
     }
 
 def run_training(avatar_id: str, video_path: str, audio_path: str, ref_text: str):
+    """排队执行训练，超过TRAINING_CONCURRENCY的请求等待空闲槽位"""
+    with _training_slots:
+        _run_training(avatar_id, video_path, audio_path, ref_text)
+
+def _run_training(avatar_id: str, video_path: str, audio_path: str, ref_text: str):
     """执行训练过程"""
     try:
         logger.info(f"执行训练: avatar={avatar_id}")
         
         sessions[avatar_id]["status"] = "training"
         
-        # 切换到wav2lip目录
-        os.chdir(WAV2LIP_PATH)
-        
         # 构建训练命令
         cmd = [
             "python",
             "genavatar.py",
-            "--video_path", video_path,
+            "--video_path", os.path.abspath(video_path),  # 子进程cwd为wav2lip目录，需传绝对路径
             "--img_size", "256",
             "--avatar_id", avatar_id
         ]
@@ -280,44 +507,47 @@ def run_training(avatar_id: str, video_path: str, audio_path: str, ref_text: str
         logger.info(f"训练命令: {' '.join(cmd)}")
         
         # 创建日志文件
-        log_file = LOGS_DIR / f"train_{avatar_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log"
+        log_file = LOGS_DIR / f"train_{avatar_id}_{file_stamp()}.log"
         
-        # 启动训练进程
-        with open(log_file, "w", encoding='utf-8') as f:
+        # 启动训练进程；子进程继承日志文件句柄后父进程即可关闭，不在等待期间一直占用
+        with open(log_file, "wb", buffering=0) as f:
             process = subprocess.Popen(
                 cmd,
                 stdout=f,
                 stderr=subprocess.STDOUT,
-                text=True,
+                bufsize=-1,  # 子进程直接写日志文件的fd，父进程不经过管道；显式使用默认缓冲
                 cwd=WAV2LIP_PATH,
-                creationflags=subprocess.CREATE_NEW_CONSOLE
+                close_fds=True,
+                creationflags=CREATION_FLAGS
             )
             
-            training_processes[avatar_id] = process
-            
-            # 等待训练完成
-            return_code = process.wait(timeout=1200)  # 20分钟超时
+        assign_job(process.pid)
+        training_processes[avatar_id] = process
+        refresh_process_status()
+        
+        # 等待训练完成
+        return_code = process.wait(timeout=1200)  # 20分钟超时
+        
+        if return_code == 0:
+            logger.info(f"训练成功: {avatar_id}")
             
-            if return_code == 0:
-                logger.info(f"训练成功: {avatar_id}")
+            # 移动训练结果到data/avatars
+            if move_trained_avatar(avatar_id):
+                sessions[avatar_id]["status"] = "ready"
                 
-                # 移动训练结果到data/avatars
-                if move_trained_avatar(avatar_id):
-                    sessions[avatar_id]["status"] = "ready"
-                    
-                    # 复制音频文件到wav目录
-                    audio_filename = f"{avatar_id}.wav"
-                    dest_audio = os.path.join(WAV_DIR, audio_filename)
-                    shutil.copy2(audio_path, dest_audio)
-                    sessions[avatar_id]["ref_file"] = f"wav/{audio_filename}"
-                    logger.info(f"音频文件已复制到: {dest_audio}")
-                else:
-                    sessions[avatar_id]["status"] = "error"
-                    sessions[avatar_id]["error"] = "无法移动训练结果"
+                # 复制音频文件到wav目录
+                audio_filename = f"{avatar_id}.wav"
+                dest_audio = os.path.join(WAV_DIR, audio_filename)
+                shutil.copyfile(audio_path, dest_audio)  # 不复制元数据，Linux上走sendfile
+                sessions[avatar_id]["ref_file"] = f"wav/{audio_filename}"
+                logger.info(f"音频文件已复制到: {dest_audio}")
             else:
-                logger.error(f"训练失败，返回码: {return_code}")
                 sessions[avatar_id]["status"] = "error"
-                sessions[avatar_id]["error"] = f"训练失败，返回码: {return_code}"
+                sessions[avatar_id]["error"] = "无法移动训练结果"
+        else:
+            logger.error(f"训练失败，返回码: {return_code}")
+            sessions[avatar_id]["status"] = "error"
+            sessions[avatar_id]["error"] = f"训练失败，返回码: {return_code}"
     
     except subprocess.TimeoutExpired:
         logger.error(f"训练超时: {avatar_id}")
@@ -332,9 +562,10 @@ def run_training(avatar_id: str, video_path: str, audio_path: str, ref_text: str
         sessions[avatar_id]["error"] = str(e)
     
     finally:
-        if avatar_id in training_processes:
-            del training_processes[avatar_id]
-        os.chdir(Path(__file__).parent)
+        process = training_processes.pop(avatar_id, None)
+        if process is not None:
+            process_jobs.pop(process.pid, None)
+        refresh_process_status(force=True)
 
 @app.post("/start")
 async def start_avatar(request: StartRequest):
@@ -353,8 +584,6 @@ async def start_avatar(request: StartRequest):
             raise HTTPException(status_code=400, detail="该数字人已在运行")
     
     try:
-        os.chdir(LIVETALKING_PATH)
-        
         # 获取音频文件和参考文本
         ref_file = f"wav/{avatar_id}.wav"
         ref_text = sessions.get(avatar_id, {}).get("ref_text", "Hello, I am a digital avatar.")
@@ -387,19 +616,22 @@ async def start_avatar(request: StartRequest):
         logger.info(f"启动命令: {' '.join(cmd)}")
         
         # 创建日志文件
-        log_file = LOGS_DIR / f"run_{avatar_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log"
+        log_file = LOGS_DIR / f"run_{avatar_id}_{file_stamp()}.log"
         
-        # 启动进程
-        with open(log_file, "w", encoding='utf-8') as f:
+        # 启动进程（创建日志文件放到线程池，不在事件循环上做磁盘IO）
+        f = await run_in_threadpool(open, log_file, "wb", 0)
+        with f:
             process = subprocess.Popen(
                 cmd,
                 stdout=f,
                 stderr=subprocess.STDOUT,
-                text=True,
+                bufsize=-1,
                 cwd=LIVETALKING_PATH,
-                creationflags=subprocess.CREATE_NEW_CONSOLE
+                close_fds=True,
+                creationflags=CREATION_FLAGS
             )
         
+        assign_job(process.pid)
         running_processes[avatar_id] = process
         
         # 更新状态
@@ -407,12 +639,16 @@ async def start_avatar(request: StartRequest):
             sessions[avatar_id] = {}
         sessions[avatar_id]["status"] = "running"
         sessions[avatar_id]["pid"] = process.pid
+        refresh_process_status()
         
-        time.sleep(2)
+        # 端口可连接即提前返回，不阻塞事件循环
+        await wait_for_start(process)
         
         if process.poll() is not None:
             del running_processes[avatar_id]
+            process_jobs.pop(process.pid, None)
             sessions[avatar_id]["status"] = "error"
+            refresh_process_status()
             raise HTTPException(status_code=500, detail="启动失败，进程已退出")
         
         logger.info(f"成功启动数字人: {avatar_id}, PID: {process.pid}")
@@ -421,7 +657,7 @@ async def start_avatar(request: StartRequest):
             "status": "started",
             "avatar_id": avatar_id,
             "pid": process.pid,
-            "webrtc_url": "http://localhost:8010"
+            "webrtc_url": f"http://localhost:{LIVETALKING_PORT}"
         }
     
     except Exception as e:
@@ -429,9 +665,6 @@ async def start_avatar(request: StartRequest):
         if avatar_id in sessions:
             sessions[avatar_id]["status"] = "error"
         raise HTTPException(status_code=500, detail=f"启动失败: {e}")
-    
-    finally:
-        os.chdir(Path(__file__).parent)
 
 @app.post("/stop")
 async def stop_avatar(request: StopRequest):
@@ -448,6 +681,7 @@ async def stop_avatar(request: StopRequest):
         
         kill_process_tree(pid)
         del running_processes[avatar_id]
+        refresh_process_status()
         
         if avatar_id in sessions:
             sessions[avatar_id]["status"] = "ready"
@@ -467,22 +701,35 @@ async def stop_avatar(request: StopRequest):
         raise HTTPException(status_code=500, detail=f"停止失败: {e}")
 
 @app.post("/upload/video")
-async def upload_video(file: UploadFile = File(...)):
-    """上传MP4视频文件"""
-    
-    # 检查文件格式
-    if not file.filename.lower().endswith('.mp4'):
-        raise HTTPException(status_code=400, detail="只支持MP4格式的视频")
-    
-    # 生成唯一文件名
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"{timestamp}_{file.filename}"
-    
-    # 保存视频
-    video_path = UPLOAD_DIR / filename
-    with open(video_path, "wb") as f:
-        content = await file.read()
-        f.write(content)
+async def upload_video(request: Request, filename: Optional[str] = None):
+    """上传MP4视频文件
+    
+    - multipart表单（字段名file）：与原有前端兼容
+    - 原始请求体（Content-Type: video/mp4，文件名放在 ?filename= 中）：
+      直接写入uploads，不会先落到临时文件再复制一遍
+    """
+    
+    if request.headers.get("content-type", "").startswith("multipart/form-data"):
+        async with request.form() as form:
+            file = form.get("file")
+            if not isinstance(file, FormFile):
+                raise HTTPException(status_code=400, detail="缺少file字段")
+            
+            # 检查文件格式
+            if not file.filename.lower().endswith('.mp4'):
+                raise HTTPException(status_code=400, detail="只支持MP4格式的视频")
+            
+            # 生成唯一文件名并保存视频
+            filename = f"{file_stamp()}_{file.filename}"
+            video_path = UPLOAD_DIR / filename
+            await save_upload(file, video_path)
+    else:
+        if not filename or not filename.lower().endswith('.mp4'):
+            raise HTTPException(status_code=400, detail="只支持MP4格式的视频")
+        
+        filename = f"{file_stamp()}_{os.path.basename(filename)}"
+        video_path = UPLOAD_DIR / filename
+        await save_stream(request, video_path)
     
     logger.info(f"视频上传成功: {video_path}")
     
@@ -500,14 +747,11 @@ async def upload_audio(file: UploadFile = File(...)):
         raise HTTPException(status_code=400, detail="只支持WAV格式的音频")
     
     # 生成唯一文件名
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"{timestamp}_{file.filename}"
+    filename = f"{file_stamp()}_{file.filename}"
     
     # 保存音频
     audio_path = UPLOAD_DIR / filename
-    with open(audio_path, "wb") as f:
-        content = await file.read()
-        f.write(content)
+    await save_upload(file, audio_path)
     
     logger.info(f"音频上传成功: {audio_path}")
     
@@ -551,9 +795,18 @@ async def health_check():
         "training": len(training_processes)
     }
 
+@app.on_event("startup")
+async def startup_event():
+    """启动后台进程状态检查"""
+    global _reaper_task
+    _reaper_task = asyncio.create_task(reap_processes())
+
 @app.on_event("shutdown")
 async def shutdown_event():
-    """关闭时清理所有进程"""
+    """关闭时停止状态检查任务并清理所有进程"""
+    if _reaper_task is not None:
+        _reaper_task.cancel()
+    
     logger.info("正在关闭所有运行中的进程...")
     
     for avatar_id, process in list(running_processes.items()):
@@ -580,9 +833,12 @@ if __name__ == "__main__":
     logger.info(f"发现 {len(existing_avatars)} 个数字人: {existing_avatars}")
     
     # 启动服务器
+    # 会话和进程状态保存在进程内，只能单worker运行；有uvloop/httptools时使用它们加速上传
     uvicorn.run(
         app,
         host="0.0.0.0",
         port=8000,
-        reload=False
+        reload=False,
+        loop="uvloop" if uvloop is not None else "asyncio",
+        http="httptools" if httptools is not None else "h11"
     )
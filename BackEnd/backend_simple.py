@@ -2,20 +2,39 @@
 LiveTalking 后端API服务 - 简化稳定版
 """
 
-from fastapi import FastAPI, HTTPException, BackgroundTasks, File, UploadFile
+from fastapi import FastAPI, HTTPException, BackgroundTasks, File, UploadFile, Request, Response
+from fastapi.responses import JSONResponse, ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
 import uvicorn
 import subprocess
+import asyncio
 import os
 import time
 import shutil
+import itertools
 import logging
-from typing import Dict, List
+from typing import Dict, List, Optional
 from pathlib import Path
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 import psutil
 
+try:
+    import uvloop  # 可选（Linux/macOS）: pip install uvloop
+except ImportError:
+    uvloop = None
+
+try:
+    import httptools  # 可选: pip install httptools
+except ImportError:
+    httptools = None
+
+try:
+    import orjson  # 可选: pip install orjson
+except ImportError:
+    orjson = None
+
 # ==================== 配置 ====================
 # LiveTalking项目路径
 LIVETALKING_PATH = r"D:\Projects\See You Again\src\LiveTalking\LiveTalking-main"
@@ -26,9 +45,16 @@ RESULTS_DIR = os.path.join(LIVETALKING_PATH, "wav2lip", "results", "avatars")
 WAV_DIR = os.path.join(LIVETALKING_PATH, "wav")
 WAV2LIP_DIR = os.path.join(LIVETALKING_PATH, "wav2lip")
 
+# LiveTalking WebRTC端口，启动后探测该端口判断是否就绪
+LIVETALKING_PORT = 8010
+START_CHECK_TIMEOUT = 3.0  # 启动检查最长等待时间（秒）
+START_MIN_WAIT = 1.0  # 端口可连接后至少等待的时间（秒），确认进程没有因端口占用退出
+
 # 本地目录
 UPLOAD_DIR = Path("uploads")
 LOGS_DIR = Path("logs")
+UPLOAD_CHUNK_SIZE = 1 << 20  # 上传分块大小（1MB）
+TRAINING_CONCURRENCY = 2  # 同时训练上限，其余排队
 
 # 创建本地目录
 UPLOAD_DIR.mkdir(exist_ok=True)
@@ -42,7 +68,10 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # ==================== FastAPI ====================
-app = FastAPI(title="LiveTalking Backend")
+app = FastAPI(
+    title="LiveTalking Backend",
+    default_response_class=ORJSONResponse if orjson is not None else JSONResponse
+)
 
 app.add_middleware(
     CORSMiddleware,
@@ -59,6 +88,15 @@ running_processes: Dict[str, subprocess.Popen] = {}
 # 训练状态
 training_status: Dict[str, str] = {}
 
+# 目录扫描缓存: (路径, 前缀, 是否只要目录) -> (目录mtime, 条目名列表)
+_dir_cache: Dict[tuple, tuple] = {}
+
+# 上传文件名序号，避免同一秒内重名
+_file_seq = itertools.count()
+
+# 训练槽位，在startup中创建：Python 3.9的asyncio原语会绑定导入时的事件循环，而uvicorn在新的循环中运行
+_training_slots: Optional[asyncio.Semaphore] = None
+
 # ==================== 数据模型 ====================
 class StartRequest(BaseModel):
     avatar_id: str
@@ -72,30 +110,107 @@ class TrainRequest(BaseModel):
     ref_text: str
 
 # ==================== 工具函数 ====================
+def list_dir(path: str, prefix: str = "", dirs_only: bool = False) -> List[str]:
+    """列出目录中以prefix开头的条目，目录mtime未变化时返回缓存
+    
+    先按名字过滤再判断类型；DirEntry.is_dir()使用目录项自带的类型，只有符号链接才需要stat
+    """
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return []
+    
+    key = (path, prefix, dirs_only)
+    cached = _dir_cache.get(key)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    
+    with os.scandir(path) as entries:
+        names = [
+            e.name for e in entries
+            if e.name.startswith(prefix) and (not dirs_only or e.is_dir())
+        ]
+    _dir_cache[key] = (mtime, names)
+    return names
+
 def scan_avatars() -> List[Dict]:
     """扫描已有数字人"""
     avatars = []
     
-    if os.path.exists(AVATARS_DIR):
-        for item in os.listdir(AVATARS_DIR):
-            if item.startswith("wav2lip256_"):
-                avatar_path = os.path.join(AVATARS_DIR, item)
-                if os.path.isdir(avatar_path):
-                    # 检查对应的音频文件
-                    wav_file = os.path.join(WAV_DIR, f"{item}.wav")
-                    has_audio = os.path.exists(wav_file)
-                    
-                    avatars.append({
-                        "id": item,
-                        "name": item.replace("wav2lip256_", ""),
-                        "path": avatar_path,
-                        "has_audio": has_audio,
-                        "is_running": item in running_processes
-                    })
+    # 音频目录只列一次，逐个数字人用集合判断
+    wav_files = {f for f in list_dir(WAV_DIR) if f.endswith(".wav")}
+    
+    for item in list_dir(AVATARS_DIR, prefix="wav2lip256_", dirs_only=True):
+        avatars.append({
+            "id": item,
+            "name": item.replace("wav2lip256_", ""),
+            "path": os.path.join(AVATARS_DIR, item),
+            "has_audio": f"{item}.wav" in wav_files,
+            "is_running": item in running_processes
+        })
     
     logger.info(f"扫描到 {len(avatars)} 个数字人")
     return avatars
 
+def _copy_upload(src, path: Path):
+    src.seek(0)
+    with open(path, "wb") as f:
+        shutil.copyfileobj(src, f, UPLOAD_CHUNK_SIZE)
+
+async def save_upload(file: UploadFile, path: Path):
+    """分块写入上传文件，避免整个文件读入内存
+    
+    直接从Starlette的临时文件按块复制，整个复制在线程池中一次完成
+    """
+    await run_in_threadpool(_copy_upload, file.file, path)
+
+def install_avatar(avatar_id: str, audio_path: str) -> bool:
+    """把训练结果移到数字人目录并复制参考音频，返回训练结果是否存在"""
+    source = os.path.join(RESULTS_DIR, avatar_id)
+    dest = os.path.join(AVATARS_DIR, avatar_id)
+    
+    if not os.path.exists(source):
+        return False
+    
+    if os.path.exists(dest):
+        shutil.rmtree(dest)
+    
+    # 同一磁盘上直接重命名，跨磁盘时才复制
+    try:
+        os.replace(source, dest)
+    except OSError:
+        shutil.move(source, dest)
+    
+    # 复制音频（不复制元数据，Linux上走sendfile）
+    wav_dest = os.path.join(WAV_DIR, f"{avatar_id}.wav")
+    shutil.copyfile(audio_path, wav_dest)
+    return True
+
+async def wait_for_start(process: subprocess.Popen):
+    """最多等待START_CHECK_TIMEOUT秒，进程退出或WebRTC端口可连接时提前返回
+    
+    端口可能已被其他LiveTalking实例占用，此时新进程会因绑定失败退出；
+    因此端口可连接后仍至少等到启动后START_MIN_WAIT秒，再由调用方检查进程是否存活
+    """
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    deadline = started + START_CHECK_TIMEOUT
+    while loop.time() < deadline:
+        if process.poll() is not None:
+            return
+        try:
+            _, writer = await asyncio.wait_for(
+                asyncio.open_connection("127.0.0.1", LIVETALKING_PORT), timeout=0.1
+            )
+        except (OSError, asyncio.TimeoutError):
+            await asyncio.sleep(0.1)
+            continue
+        writer.close()
+        break
+    
+    while loop.time() < started + START_MIN_WAIT and process.poll() is None:
+        await asyncio.sleep(0.1)
+
 def kill_process(pid):
     """终止进程"""
     try:
@@ -155,8 +270,8 @@ async def start_avatar(request: StartRequest):
         
         running_processes[avatar_id] = process
         
-        # 等待确认启动
-        time.sleep(3)
+        # 等待确认启动（端口可连接即提前返回，不阻塞事件循环）
+        await wait_for_start(process)
         
         if process.poll() is not None:
             del running_processes[avatar_id]
@@ -205,8 +320,13 @@ async def train_avatar(request: TrainRequest, background: BackgroundTasks):
         "avatar_id": avatar_id
     }
 
-def run_training(avatar_id: str, video_path: str, audio_path: str, ref_text: str):
-    """执行训练"""
+async def run_training(avatar_id: str, video_path: str, audio_path: str, ref_text: str):
+    """排队执行训练，超过TRAINING_CONCURRENCY的请求等待空闲槽位"""
+    async with _training_slots:
+        await _run_training(avatar_id, video_path, audio_path, ref_text)
+
+async def _run_training(avatar_id: str, video_path: str, audio_path: str, ref_text: str):
+    """执行训练（异步等待子进程，不占用线程池）"""
     try:
         logger.info(f"开始训练: {avatar_id}")
         
@@ -219,48 +339,52 @@ def run_training(avatar_id: str, video_path: str, audio_path: str, ref_text: str
             "--avatar_id", avatar_id
         ]
         
-        # 执行训练
-        result = subprocess.run(
-            cmd,
+        # 执行训练，输出异步读取，不会因管道写满而卡住
+        process = await asyncio.create_subprocess_exec(
+            *cmd,
             cwd=WAV2LIP_DIR,
-            capture_output=True,
-            text=True,
-            timeout=1800  # 30分钟超时
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT
         )
+        try:
+            stdout, _ = await asyncio.wait_for(process.communicate(), timeout=1800)  # 30分钟超时
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+            raise
         
-        if result.returncode == 0:
-            # 移动结果
-            source = os.path.join(RESULTS_DIR, avatar_id)
-            dest = os.path.join(AVATARS_DIR, avatar_id)
-            
-            if os.path.exists(source):
-                if os.path.exists(dest):
-                    shutil.rmtree(dest)
-                shutil.move(source, dest)
-                
-                # 复制音频
-                wav_dest = os.path.join(WAV_DIR, f"{avatar_id}.wav")
-                shutil.copy2(audio_path, wav_dest)
-                
+        if process.returncode == 0:
+            # 移动结果（文件操作放到线程中，不阻塞事件循环）
+            if await asyncio.to_thread(install_avatar, avatar_id, audio_path):
                 training_status[avatar_id] = "completed"
                 logger.info(f"训练完成: {avatar_id}")
             else:
                 training_status[avatar_id] = "error"
-                logger.error(f"训练结果不存在: {source}")
+                logger.error(f"训练结果不存在: {os.path.join(RESULTS_DIR, avatar_id)}")
         else:
             training_status[avatar_id] = "error"
-            logger.error(f"训练失败: {result.stderr}")
+            logger.error(f"训练失败: {stdout.decode(errors='replace')}")
             
+    except asyncio.TimeoutError:
+        training_status[avatar_id] = "error"
+        logger.error(f"训练超时: {avatar_id}")
+    
     except Exception as e:
         training_status[avatar_id] = "error"
         logger.error(f"训练异常: {e}")
 
 @app.get("/training/{avatar_id}")
-async def get_training_status(avatar_id: str):
-    """获取训练状态"""
+async def get_training_status(avatar_id: str, request: Request, response: Response):
+    """获取训练状态，状态未变化时返回304"""
+    status = training_status.get(avatar_id, "unknown")
+    etag = f'"{status}"'
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    
+    response.headers["ETag"] = etag
     return {
         "avatar_id": avatar_id,
-        "status": training_status.get(avatar_id, "unknown")
+        "status": status
     }
 
 @app.post("/upload/video")
@@ -269,11 +393,9 @@ async def upload_video(file: UploadFile = File(...)):
     if not file.filename.lower().endswith('.mp4'):
         raise HTTPException(status_code=400, detail="只支持MP4格式")
     
-    filepath = UPLOAD_DIR / f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{file.filename}"
+    filepath = UPLOAD_DIR / f"{time.strftime('%Y%m%d_%H%M%S')}_{next(_file_seq)}_{file.filename}"
     
-    with open(filepath, "wb") as f:
-        content = await file.read()
-        f.write(content)
+    await save_upload(file, filepath)
     
     return {"path": str(filepath)}
 
@@ -283,23 +405,35 @@ async def upload_audio(file: UploadFile = File(...)):
     if not file.filename.lower().endswith('.wav'):
         raise HTTPException(status_code=400, detail="只支持WAV格式")
     
-    filepath = UPLOAD_DIR / f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{file.filename}"
+    filepath = UPLOAD_DIR / f"{time.strftime('%Y%m%d_%H%M%S')}_{next(_file_seq)}_{file.filename}"
     
-    with open(filepath, "wb") as f:
-        content = await file.read()
-        f.write(content)
+    await save_upload(file, filepath)
     
     return {"path": str(filepath)}
 
 @app.get("/health")
-async def health():
-    """健康检查"""
-    return {
+async def health(include: str = ""):
+    """健康检查，include=avatars时一并返回数字人列表"""
+    avatars = scan_avatars()
+    result = {
         "status": "ok",
-        "avatars_count": len(scan_avatars()),
+        "avatars_count": len(avatars),
         "running_count": len(running_processes),
         "training_count": len([s for s in training_status.values() if s == "training"])
     }
+    if "avatars" in include.split(","):
+        result["avatars"] = avatars
+    return result
+
+@app.on_event("startup")
+async def startup():
+    """创建训练槽位，限制默认线程池，训练后的文件操作排队执行"""
+    global _training_slots
+    _training_slots = asyncio.Semaphore(TRAINING_CONCURRENCY)
+    
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=TRAINING_CONCURRENCY, thread_name_prefix="training")
+    )
 
 @app.on_event("shutdown")
 async def shutdown():
@@ -313,4 +447,10 @@ if __name__ == "__main__":
     logger.info(f"数字人目录: {AVATARS_DIR}")
     logger.info(f"已有数字人: {[a['name'] for a in scan_avatars()]}")
     
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    uvicorn.run(
+        app,
+        host="0.0.0.0",
+        port=8000,
+        loop="uvloop" if uvloop is not None else "asyncio",
+        http="httptools" if httptools is not None else "h11"
+    )
@@ -4,33 +4,101 @@ LiveTalking 前端界面 - 简化稳定版
 
 import gradio as gr
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+try:
+    from requests_toolbelt import MultipartEncoder
+except ImportError:
+    MultipartEncoder = None
 import time
 import threading
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Tuple
 import os
 
 # 配置
 BACKEND_URL = "http://localhost:8000"
+WEBRTC_URL = "http://localhost:8010"  # LiveTalking WebRTC地址
+DEFAULT_TIMEOUT = (1.0, 5.0)  # (连接超时, 读取超时)
+UPLOAD_TIMEOUT = (1, 300)  # 上传大文件时后端需要较长时间写盘
+AVATARS_CACHE_TTL = 5  # 数字人列表缓存秒数，定时刷新与手动刷新共享同一次请求
+HEALTH_CACHE_TTL = 2  # 健康检查结果缓存秒数
+MONITOR_INTERVAL = 10  # 训练状态初始轮询间隔（秒）
+MONITOR_MAX_INTERVAL = 60  # 状态长时间不变时轮询间隔上限（秒）
+
+class _TimeoutSession(requests.Session):
+    """未显式指定timeout时使用默认超时，避免请求卡死工作线程"""
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", DEFAULT_TIMEOUT)
+        return super().request(method, url, **kwargs)
+
+# 全局复用的HTTP会话，保持到后端的长连接
+SESSION = _TimeoutSession()
+SESSION.mount("http://", HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=16,
+    # POST不幂等（上传、训练、启动），只重试GET；连接失败时请求尚未发出，所有方法都可重试
+    max_retries=Retry(
+        total=2,
+        connect=2,
+        backoff_factor=0.1,
+        status_forcelist=[502, 503, 504],
+        allowed_methods=["GET"]
+    )
+))
+SESSION.headers.update({"Connection": "keep-alive"})
+
+# WebRTC iframe，启动成功后直接返回
+_VIDEO_IFRAME_HTML = f'''
+            <iframe 
+                src="{WEBRTC_URL}" 
+                width="100%" 
+                height="600" 
+                frameborder="0"
+                allow="camera; microphone"
+                style="border-radius: 10px; background: #000;">
+            </iframe>
+            '''
 
 # 全局变量
 current_avatar = None
 available_avatars = []
+_avatars_cache = {"t": 0.0, "v": []}
+_health_cache = {"t": 0.0, "v": ""}
+_last_sig = None  # 上次生成选项时的列表特征
+_last_choices: List[str] = []
 
-def refresh_avatars():
-    """刷新数字人列表"""
-    global available_avatars
+def invalidate_avatars():
+    """数字人状态变化后让下次刷新重新请求后端"""
+    _avatars_cache["t"] = 0.0
+
+def build_choices(avatars: List[Dict]) -> List[str]:
+    """根据数字人列表生成下拉选项，并更新列表缓存"""
+    global available_avatars, _last_sig, _last_choices
+    available_avatars = avatars
+    # 列表内容未变化时复用上次的选项
+    sig = tuple((a["id"], a["name"], a["is_running"], a["has_audio"]) for a in avatars)
+    if sig != _last_sig:
+        _last_choices = [
+            f"{'🟢' if a['is_running'] else '⚪'} {'🔊' if a['has_audio'] else '🔇'} {a['name']}"
+            for a in avatars
+        ]
+        _last_sig = sig
+    _avatars_cache["t"] = time.monotonic()
+    _avatars_cache["v"] = _last_choices
+    return _last_choices
+
+def refresh_avatars(prefetched: List[Dict] = None):
+    """刷新数字人列表，prefetched为已取得的数字人列表时不再请求后端"""
+    if prefetched is not None:
+        return build_choices(prefetched)
+    if time.monotonic() - _avatars_cache["t"] < AVATARS_CACHE_TTL:
+        return _avatars_cache["v"]
+    
     try:
-        response = requests.get(f"{BACKEND_URL}/avatars")
+        response = SESSION.get(f"{BACKEND_URL}/avatars")
         if response.status_code == 200:
-            avatars = response.json()["avatars"]
-            available_avatars = avatars
-            # 创建选项列表
-            choices = []
-            for avatar in avatars:
-                status = "🟢" if avatar["is_running"] else "⚪"
-                audio = "🔊" if avatar["has_audio"] else "🔇"
-                choices.append(f"{status} {audio} {avatar['name']}")
-            return choices
+            return build_choices(response.json()["avatars"])
     except Exception as e:
         print(f"刷新失败: {e}")
     return []
@@ -65,7 +133,7 @@ def start_existing_avatar(avatar_select, ref_text):
         ref_text = "Hello, I am a digital avatar."
     
     try:
-        response = requests.post(
+        response = SESSION.post(
             f"{BACKEND_URL}/start",
             json={
                 "avatar_id": avatar["id"],
@@ -78,23 +146,14 @@ def start_existing_avatar(avatar_select, ref_text):
             data = response.json()
             global current_avatar
             current_avatar = avatar["id"]
-            
-            # WebRTC iframe
-            video_html = f'''
-            <iframe 
-                src="http://localhost:8010" 
-                width="100%" 
-                height="600" 
-                frameborder="0"
-                allow="camera; microphone"
-                style="border-radius: 10px; background: #000;">
-            </iframe>
-            '''
-            return f"✅ 启动成功 (PID: {data['pid']})", video_html
+            invalidate_avatars()
+            return f"✅ 启动成功 (PID: {data['pid']})", _VIDEO_IFRAME_HTML
         else:
             error = response.json().get("detail", "未知错误")
             return f"❌ 启动失败: {error}", ""
             
+    except requests.Timeout:
+        return "❌ 后端响应超时，请稍后重试", ""
     except Exception as e:
         return f"❌ 错误: {e}", ""
 
@@ -105,47 +164,60 @@ def stop_current_avatar():
         return "没有运行中的数字人"
     
     try:
-        response = requests.post(f"{BACKEND_URL}/stop/{current_avatar}")
+        response = SESSION.post(f"{BACKEND_URL}/stop/{current_avatar}")
         current_avatar = None
+        invalidate_avatars()
         return "✅ 已停止"
+    except requests.Timeout:
+        return "❌ 停止超时，请稍后重试"
     except Exception as e:
         return f"❌ 停止失败: {e}"
 
+def upload_file(endpoint: str, path: str, filename: str, content_type: str) -> requests.Response:
+    """以multipart上传文件，有requests_toolbelt时分块流式发送"""
+    url = f"{BACKEND_URL}{endpoint}"
+    with open(path, "rb") as f:
+        if MultipartEncoder is None:
+            return SESSION.post(url, files={"file": (filename, f, content_type)}, timeout=UPLOAD_TIMEOUT)
+        
+        encoder = MultipartEncoder(fields={"file": (filename, f, content_type)})
+        return SESSION.post(
+            url,
+            data=encoder,
+            headers={"Content-Type": encoder.content_type},
+            timeout=UPLOAD_TIMEOUT
+        )
+
 def train_new_avatar(avatar_name, video_file, audio_file, ref_text):
     """训练新数字人"""
     # 验证输入
     if not all([avatar_name, video_file, audio_file, ref_text]):
         return "❌ 请填写所有字段"
     
-    if not video_file.endswith('.mp4'):
+    # 扩展名不区分大小写，在打开文件之前检查
+    if os.path.splitext(video_file)[1].lower() != ".mp4":
         return "❌ 视频必须是MP4格式"
     
-    if not audio_file.endswith('.wav'):
+    if os.path.splitext(audio_file)[1].lower() != ".wav":
         return "❌ 音频必须是WAV格式"
     
     try:
-        # 上传视频
-        with open(video_file, "rb") as f:
-            response = requests.post(
-                f"{BACKEND_URL}/upload/video",
-                files={"file": ("video.mp4", f, "video/mp4")}
-            )
-            if response.status_code != 200:
-                return f"❌ 视频上传失败"
-            video_path = response.json()["path"]
+        # 并发上传视频和音频
+        with ThreadPoolExecutor(max_workers=2) as ex:
+            fv = ex.submit(upload_file, "/upload/video", video_file, "video.mp4", "video/mp4")
+            fa = ex.submit(upload_file, "/upload/audio", audio_file, "audio.wav", "audio/wav")
+            video_response, audio_response = fv.result(), fa.result()
         
-        # 上传音频
-        with open(audio_file, "rb") as f:
-            response = requests.post(
-                f"{BACKEND_URL}/upload/audio",
-                files={"file": ("audio.wav", f, "audio/wav")}
-            )
-            if response.status_code != 200:
-                return f"❌ 音频上传失败"
-            audio_path = response.json()["path"]
+        if video_response.status_code != 200:
+            return f"❌ 视频上传失败"
+        video_path = video_response.json()["path"]
+        
+        if audio_response.status_code != 200:
+            return f"❌ 音频上传失败"
+        audio_path = audio_response.json()["path"]
         
         # 开始训练
-        response = requests.post(
+        response = SESSION.post(
             f"{BACKEND_URL}/train",
             json={
                 "avatar_id": avatar_name,
@@ -157,52 +229,120 @@ def train_new_avatar(avatar_name, video_file, audio_file, ref_text):
         
         if response.status_code == 200:
             avatar_id = response.json()["avatar_id"]
+            invalidate_avatars()
             
-            # 启动监控线程
-            threading.Thread(
-                target=monitor_training,
-                args=(avatar_id,),
-                daemon=True
-            ).start()
+            # 加入训练监控
+            watch_training(avatar_id)
             
             return f"✅ 开始训练 {avatar_id}，预计需要10-20分钟..."
         else:
             return f"❌ 训练请求失败"
             
+    except requests.Timeout:
+        return "❌ 后端响应超时，请稍后重试"
     except Exception as e:
         return f"❌ 错误: {e}"
 
-def monitor_training(avatar_id):
-    """监控训练状态"""
-    while True:
-        try:
-            response = requests.get(f"{BACKEND_URL}/training/{avatar_id}")
-            if response.status_code == 200:
-                status = response.json()["status"]
-                if status == "completed":
-                    print(f"✅ {avatar_id} 训练完成！")
-                    break
-                elif status == "error":
-                    print(f"❌ {avatar_id} 训练失败！")
-                    break
-        except:
-            pass
-        time.sleep(10)
+# 训练监控: avatar_id -> {"etag", "interval", "next"}，由同一个后台线程轮询
+_monitored: Dict[str, dict] = {}
+_monitor_lock = threading.Lock()
+_monitor_wakeup = threading.Event()
+_monitor_thread = None
+
+def watch_training(avatar_id):
+    """把训练任务加入监控，需要时启动监控线程"""
+    global _monitor_thread
+    with _monitor_lock:
+        _monitored[avatar_id] = {"etag": None, "interval": MONITOR_INTERVAL, "next": 0.0}
+        if _monitor_thread is None or not _monitor_thread.is_alive():
+            _monitor_thread = threading.Thread(target=monitor_training, daemon=True)
+            _monitor_thread.start()
+    _monitor_wakeup.set()
 
-def check_health():
-    """检查后端状态"""
+def poll_training(avatar_id, state) -> bool:
+    """查询一次训练状态，训练结束时返回True
+    
+    状态不变时逐步拉长轮询间隔，并用ETag条件请求让后端返回304
+    """
     try:
-        response = requests.get(f"{BACKEND_URL}/health")
+        headers = {"If-None-Match": state["etag"]} if state["etag"] else None
+        response = SESSION.get(f"{BACKEND_URL}/training/{avatar_id}", headers=headers)
         if response.status_code == 200:
+            state["etag"] = response.headers.get("ETag")
+            state["interval"] = MONITOR_INTERVAL
+            status = response.json()["status"]
+            if status == "completed":
+                print(f"✅ {avatar_id} 训练完成！")
+                invalidate_avatars()
+                return True
+            elif status == "error":
+                print(f"❌ {avatar_id} 训练失败！")
+                return True
+    except requests.RequestException:
+        pass
+    state["next"] = time.monotonic() + state["interval"]
+    state["interval"] = min(MONITOR_MAX_INTERVAL, state["interval"] * 1.5)
+    return False
+
+def monitor_training():
+    """监控所有训练中的数字人，一个线程轮询全部任务"""
+    while True:
+        _monitor_wakeup.clear()
+        now = time.monotonic()
+        with _monitor_lock:
+            due = [(aid, st) for aid, st in _monitored.items() if st["next"] <= now]
+        
+        for avatar_id, state in due:
+            if poll_training(avatar_id, state):
+                with _monitor_lock:
+                    if _monitored.get(avatar_id) is state:
+                        del _monitored[avatar_id]
+        
+        with _monitor_lock:
+            next_due = min((st["next"] for st in _monitored.values()), default=None)
+        timeout = None if next_due is None else max(0.0, next_due - time.monotonic())
+        _monitor_wakeup.wait(timeout)
+
+def check_health(prefetched: Dict = None):
+    """检查后端状态，prefetched为已取得的/health结果时不再请求后端"""
+    if prefetched is None and time.monotonic() - _health_cache["t"] < HEALTH_CACHE_TTL:
+        return _health_cache["v"]
+    
+    result = None
+    try:
+        if prefetched is not None:
+            data = prefetched
+        else:
+            response = SESSION.get(f"{BACKEND_URL}/health")
+            response.raise_for_status()
             data = response.json()
-            return f"""
+        result = f"""
 系统状态: ✅
 数字人总数: {data['avatars_count']}
 运行中: {data['running_count']}
 训练中: {data['training_count']}
 """
+    except requests.Timeout:
+        result = "系统状态: ⚠️ 后端响应超时"
     except:
-        return "系统状态: ❌ 后端未连接"
+        result = "系统状态: ❌ 后端未连接"
+    
+    _health_cache["t"] = time.monotonic()
+    _health_cache["v"] = result
+    return result
+
+def load_dashboard():
+    """页面打开时用一次/health请求同时取得状态和数字人列表"""
+    try:
+        response = SESSION.get(f"{BACKEND_URL}/health", params={"include": "avatars"})
+        if response.status_code == 200:
+            data = response.json()
+            # 旧版后端不返回avatars时单独请求列表
+            choices = refresh_avatars(data.get("avatars"))
+            return gr.update(choices=choices), check_health(data)
+    except requests.RequestException as e:
+        print(f"加载失败: {e}")
+    return gr.update(choices=refresh_avatars()), check_health()
 
 # 创建界面
 with gr.Blocks(title="LiveTalking数字人系统", theme=gr.themes.Soft()) as app:
@@ -218,7 +358,7 @@ with gr.Blocks(title="LiveTalking数字人系统", theme=gr.themes.Soft()) as ap
                     # 数字人列表
                     avatar_dropdown = gr.Dropdown(
                         label="可用数字人",
-                        choices=refresh_avatars(),
+                        choices=[],
                         interactive=True
                     )
                     
@@ -319,7 +459,7 @@ with gr.Blocks(title="LiveTalking数字人系统", theme=gr.themes.Soft()) as ap
             
             health_text = gr.Textbox(
                 label="后端状态",
-                value=check_health(),
+                value="",
                 interactive=False,
                 lines=5
             )
@@ -344,7 +484,7 @@ with gr.Blocks(title="LiveTalking数字人系统", theme=gr.themes.Soft()) as ap
     
     # 事件绑定
     refresh_btn.click(
-        fn=lambda: gr.Dropdown(choices=refresh_avatars()),
+        fn=lambda: gr.update(choices=refresh_avatars()),
         outputs=[avatar_dropdown]
     )
     
@@ -370,9 +510,15 @@ with gr.Blocks(title="LiveTalking数字人系统", theme=gr.themes.Soft()) as ap
         outputs=[health_text]
     )
     
+    # 页面打开时加载列表和状态
+    app.load(
+        fn=load_dashboard,
+        outputs=[avatar_dropdown, health_text]
+    )
+    
     # 定期刷新
     def auto_refresh():
-        return gr.Dropdown(choices=refresh_avatars())
+        return gr.update(choices=refresh_avatars())
     
     # 每30秒自动刷新列表
     timer = gr.Timer(value=30)
@@ -11,35 +11,52 @@ import time
 LIVETALKING_PATH = r"D:\Projects\See You Again\src\LiveTalking\LiveTalking-main"
 BACKEND_URL = "http://localhost:8000"
 
-def check_directories():
+# 各项API检查复用同一个HTTP会话
+SESSION = requests.Session()
+
+# 需要检查的目录
+DIRS = {
+    "数字人目录": os.path.join(LIVETALKING_PATH, "data", "avatars"),
+    "音频目录": os.path.join(LIVETALKING_PATH, "wav"),
+    "训练输出": os.path.join(LIVETALKING_PATH, "wav2lip", "results", "avatars"),
+}
+
+def scan_inventory():
+    """每个目录只读取一次，返回 {路径: 条目名列表}，目录不存在时为None"""
+    inventory = {}
+    for path in DIRS.values():
+        try:
+            with os.scandir(path) as entries:
+                inventory[path] = [e.name for e in entries]
+        except OSError:
+            inventory[path] = None
+    return inventory
+
+def check_directories(inventory):
     """检查必要目录"""
     print("\n=== 检查目录 ===")
     
-    dirs = {
-        "数字人目录": os.path.join(LIVETALKING_PATH, "data", "avatars"),
-        "音频目录": os.path.join(LIVETALKING_PATH, "wav"),
-        "训练输出": os.path.join(LIVETALKING_PATH, "wav2lip", "results", "avatars"),
-    }
-    
-    for name, path in dirs.items():
-        if os.path.exists(path):
-            count = len(os.listdir(path))
-            print(f"✅ {name}: {path} ({count} 个文件/文件夹)")
+    for name, path in DIRS.items():
+        names = inventory[path]
+        if names is not None:
+            print(f"✅ {name}: {path} ({len(names)} 个文件/文件夹)")
         else:
             print(f"❌ {name}: 不存在")
 
-def check_avatars():
+def check_avatars(inventory):
     """检查已有数字人"""
     print("\n=== 已有数字人 ===")
     
-    avatars_dir = os.path.join(LIVETALKING_PATH, "data", "avatars")
-    if os.path.exists(avatars_dir):
-        avatars = [d for d in os.listdir(avatars_dir) if d.startswith("wav2lip256_")]
+    avatars_names = inventory[DIRS["数字人目录"]]
+    if avatars_names is not None:
+        avatars = [d for d in avatars_names if d.startswith("wav2lip256_")]
+        
+        # 音频目录已在清单中，用集合判断
+        wav_set = {n for n in inventory[DIRS["音频目录"]] or () if n.endswith(".wav")}
         
         for avatar in avatars:
             # 检查音频
-            wav_file = os.path.join(LIVETALKING_PATH, "wav", f"{avatar}.wav")
-            has_audio = "🔊" if os.path.exists(wav_file) else "🔇"
+            has_audio = "🔊" if f"{avatar}.wav" in wav_set else "🔇"
             print(f"  {has_audio} {avatar}")
     else:
         print("  目录不存在")
@@ -50,7 +67,7 @@ def test_backend():
     
     try:
         # 健康检查
-        response = requests.get(f"{BACKEND_URL}/health", timeout=2)
+        response = SESSION.get(f"{BACKEND_URL}/health", timeout=2)
         if response.status_code == 200:
             data = response.json()
             print(f"✅ 后端正常")
@@ -69,7 +86,7 @@ def test_avatars_api():
     print("\n=== 数字人列表API ===")
     
     try:
-        response = requests.get(f"{BACKEND_URL}/avatars", timeout=2)
+        response = SESSION.get(f"{BACKEND_URL}/avatars", timeout=2)
         if response.status_code == 200:
             avatars = response.json()["avatars"]
             print(f"✅ 获取成功，共 {len(avatars)} 个数字人:")
@@ -94,7 +111,7 @@ def check_files():
     }
     
     for name, path in files.items():
-        if os.path.exists(path):
+        if os.path.isfile(path):
             print(f"✅ {name}")
         else:
             print(f"❌ {name} 不存在: {path}")
@@ -105,14 +122,17 @@ def main():
     print("   LiveTalking 系统测试")
     print("=" * 50)
     
+    # 目录只扫描一次，供后续检查共用
+    inventory = scan_inventory()
+    
     # 1. 检查目录
-    check_directories()
+    check_directories(inventory)
     
     # 2. 检查文件
     check_files()
     
     # 3. 检查已有数字人
-    check_avatars()
+    check_avatars(inventory)
     
     # 4. 测试后端
     test_backend()